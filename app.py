@@ -6,6 +6,7 @@ import cv2
 import numpy as np
 from io import BytesIO
 import base64
+import json
 import os
 from pathlib import Path
 import asyncio
@@ -22,7 +23,11 @@ except Exception:
     torch = None
 import tempfile
 
-from face_processor import FaceRecognizer, FaceDatabase
+from face_processor import (FaceRecognizer, FaceDatabase, FaceTracker, GalleryMigration, LEGACY_MODEL_NAME,
+                            LOW_QUALITY, MODEL_TOLERANCES, summarize_embedding_stats)
+from video_processor import process_video, process_video_parallel, ffmpeg_available
+from sightings import SightingStore
+from artifact_store import ArtifactStore, file_validators, is_not_modified
 
 app = FastAPI(title="Face Recognition System")
 
@@ -39,8 +44,64 @@ if os.path.exists("uploaded_files"):
 if os.path.exists("css"):
     app.mount("/css", StaticFiles(directory="css"), name="css")
 
-db = FaceDatabase("known_faces")
-recognizer = FaceRecognizer("faces.pt", db)
+# Active and confirmation models chosen through the API, so a restart keeps them
+MODEL_SETTINGS_FILE = Path("known_faces") / "models.json"
+
+
+def load_model_settings() -> dict:
+    try:
+        with open(MODEL_SETTINGS_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"[models] Ignoring unreadable {MODEL_SETTINGS_FILE}: {e}")
+        return {}
+
+
+def save_model_settings():
+    confirm = recognizer.confirm_database
+    settings = {"active": db.model_name, "confirm": confirm.model_name if confirm is not None else None}
+    tmp_file = MODEL_SETTINGS_FILE.with_suffix(".json.tmp")
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(settings, f)
+    os.replace(tmp_file, MODEL_SETTINGS_FILE)
+
+
+model_settings = load_model_settings()
+# One gallery per embedding model on disk, so enrollments keep being mirrored to all of
+# them; `db` is the one the recognizer matches against
+galleries = {name: FaceDatabase("known_faces", name) for name in FaceDatabase.stored_models("known_faces")}
+for name in (model_settings.get("active") or LEGACY_MODEL_NAME, model_settings.get("confirm")):
+    if name and name not in galleries:
+        galleries[name] = FaceDatabase("known_faces", name)
+db = galleries[model_settings.get("active") or LEGACY_MODEL_NAME]
+confirm_name = model_settings.get("confirm")
+recognizer = FaceRecognizer("faces.pt", db, confirm_database=galleries[confirm_name]
+                            if confirm_name and confirm_name != db.model_name else None)
+print(f"[models] Matching with {db.model_name}, confirming with {confirm_name}, galleries: {sorted(galleries)}")
+sightings = SightingStore("sightings")
+artifacts = ArtifactStore("uploaded_files")
+migration = None
+
+
+def get_gallery(model_name: str) -> FaceDatabase:
+    if model_name not in MODEL_TOLERANCES:
+        raise HTTPException(status_code=400, detail=f"Unsupported model '{model_name}'")
+    if model_name not in galleries:
+        galleries[model_name] = FaceDatabase("known_faces", model_name)
+    return galleries[model_name]
+
+
+def enroll_crop(face_img: np.ndarray, name: str, wanted: bool) -> bool:
+    """Enroll a crop in the active gallery and mirror it, under the same face id, to the others."""
+    face_id = db.save_crop(face_img)
+    if not db.add_face_from_array(face_img, name, wanted, face_id):
+        return False
+    for gallery in list(galleries.values()):
+        if gallery is not db:
+            gallery.add_face_from_array(face_img, name, wanted, face_id)
+    return True
 
 webcam_active = False
 webcam_lock = asyncio.Lock()
@@ -49,6 +110,11 @@ webcam_lock = asyncio.Lock()
 app_start_time = datetime.now()
 
 
+@app.on_event("startup")
+async def start_retention_sweeper():
+    asyncio.create_task(artifacts.run_sweeper())
+
+
 @app.get("/", response_class=HTMLResponse)
 async def get_home():
     with open("templates/index.html", "r", encoding="utf-8") as f:
@@ -84,7 +150,7 @@ async def add_known_face(name: str = Form(...), file: UploadFile = File(...), wa
                     face_img = image[y1:y2, x1:x2]
                     print(f"[add_known_face] Cropped face shape: {face_img.shape}, size: {face_img.size}")
                     if face_img.size != 0:
-                        success = db.add_face_from_array(face_img, name, wanted)
+                        success = enroll_crop(face_img, name, wanted)
                     print(f"[add_known_face] add_face_from_array result: {success}")
         except Exception as e:
             print(f"[add_known_face] YOLO/crop error: {e}")
@@ -94,7 +160,7 @@ async def add_known_face(name: str = Form(...), file: UploadFile = File(...), wa
             try:
                 print(f"[add_known_face] Trying fallback: full image array")
                 if image is not None:
-                    success = db.add_face_from_array(image, name, wanted)
+                    success = enroll_crop(image, name, wanted)
                     print(f"[add_known_face] Fallback result: {success}")
                 else:
                     print(f"[add_known_face] Image is None, trying file path")
@@ -105,7 +171,16 @@ async def add_known_face(name: str = Form(...), file: UploadFile = File(...), wa
                 success = False
         
         if success:
-            return {"status": "success", "message": f"Face for '{name}' added successfully"}
+            # Relabel earlier unknown sightings of this person without reprocessing footage
+            retro_matches = 0
+            try:
+                retro_matches = sightings.retro_match(name, db.get_encodings(name)[-1:], wanted,
+                                                      recognizer.tolerance, db.model_name)
+                print(f"[add_known_face] Retro-matched {retro_matches} past sightings")
+            except Exception as e:
+                print(f"[add_known_face] Retro-match error: {e}")
+            return {"status": "success", "message": f"Face for '{name}' added successfully",
+                    "retro_matches": retro_matches}
         else:
             return {"status": "error", "message": "No face detected in image"}
     except Exception as e:
@@ -125,8 +200,11 @@ async def recognize_image(file: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="Invalid image file")
 
         results = recognizer.detect_and_recognize_faces(image)
+        safe_fname = Path(file.filename).name.replace(' ', '_') if file.filename else 'image'
+        sightings.record_detections(f"{datetime.now().timestamp()}_{safe_fname}", results)
+        sightings.flush()
 
-        output_image = recognizer.draw_results(image, results)
+        output_image = recognizer.draw_results(image, results, in_place=True)
 
         _, buffer = cv2.imencode('.jpg', output_image)
         img_b64 = base64.b64encode(buffer).decode("ascii")
@@ -137,8 +215,13 @@ async def recognize_image(file: UploadFile = File(...)):
             results["recognized"],
             results["face_locations"]
         ):
+            if name == LOW_QUALITY:
+                # Too blurry/small/turned to check against the gallery: not a cleared stranger
+                status = "low_quality"
+            else:
+                status = "wanted" if wanted else "clear"
             response_faces.append({
-                "status": "wanted" if wanted else "clear",
+                "status": status,
                 "name": name,
                 "confidence": float(confidence),
                 "wanted": wanted,
@@ -162,151 +245,66 @@ async def recognize_image(file: UploadFile = File(...)):
 
 
 @app.post("/api/recognize-video")
-async def recognize_video(file: UploadFile = File(...)):
+async def recognize_video(file: UploadFile = File(...), annotate: bool = Form(True), workers: int = Form(1)):
     try:
         contents = await file.read()
         timestamp = str(datetime.now().timestamp()).replace(".", "_")
         safe_fname = Path(file.filename).name if file.filename else 'video'
         safe_fname = safe_fname.replace(' ', '_')
         input_path = f"uploaded_files/{timestamp}_input_{safe_fname}"
-        output_path = f"uploaded_files/{timestamp}_output.mp4"
+        output_path = f"uploaded_files/{timestamp}_output.mp4" if annotate else None
         
         with open(input_path, "wb") as f:
             f.write(contents)
-        
-        cap = cv2.VideoCapture(input_path)
-        if not cap.isOpened():
-            print(f"[recognize_video] Could not open video: {input_path}")
-            raise HTTPException(status_code=400, detail="Cannot open input video file")
-        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = int(cap.get(cv2.CAP_PROP_FPS))
-        
-        if fps == 0:
-            fps = 30
-        
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
-        
-        frame_count = 0
-        recognized_count = 0
-        people_found = {}
-        
-        last_results = None
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            if frame_count % 5 == 0:
-                results = recognizer.detect_and_recognize_faces(frame)
-                last_results = results
-                for rec in (results and results.get("recognized", [])):
-                    # rec expected: (name, confidence, wanted)
-                    try:
-                        name = rec[0]
-                        conf = rec[1]
-                        wanted_flag = bool(rec[2]) if len(rec) > 2 else False
-                    except Exception:
-                        # fallback for unexpected format
-                        continue
-
-                    if name != "Unknown":
-                        if name not in people_found:
-                            people_found[name] = {"count": 0, "wanted": wanted_flag}
-                        people_found[name]["count"] += 1
-                        # If any detection shows wanted, keep it as wanted
-                        if wanted_flag:
-                            people_found[name]["wanted"] = True
-                        recognized_count += 1
-            else:
-                # Reuse last detection/recognition for intermediate frames to save processing time
-                results = last_results
-            
-            if results:
-                frame = recognizer.draw_results(frame, results)
-            
-            out.write(frame)
-            frame_count += 1
-        
-        cap.release()
-        out.release()
-        # Validate the written output with OpenCV to ensure it is readable
+
+        use_ffmpeg = ffmpeg_available()
+        print(f"[recognize_video] Using {'FFmpeg pipes' if use_ffmpeg else 'OpenCV'} for {input_path}")
         try:
-            test_cap = cv2.VideoCapture(output_path)
-            if not test_cap.isOpened():
-                print(f"Warning: output video '{output_path}' cannot be opened by OpenCV.")
+            if workers != 1:
+                # workers <= 0 means one segment per available core
+                processed = process_video_parallel(recognizer, input_path, output_path, workers if workers > 0 else None,
+                                                   sightings=sightings, source=f"{timestamp}_{safe_fname}")
             else:
-                ret_test, _ = test_cap.read()
-                print(f"Output video first frame read success: {ret_test}")
-            test_cap.release()
-        except Exception as e:
-            print(f"Error validating output video: {e}")
-        
-        if not os.path.exists(output_path):
-            raise Exception("Video file was not created")
-        
-        file_size = os.path.getsize(output_path)
-        if file_size == 0:
-            raise Exception("Video file is empty")
-        
-        print(f"Video created successfully: {output_path}, size: {file_size} bytes")
-        
-        os.remove(input_path)
+                processed = process_video(recognizer, input_path, output_path, use_ffmpeg=use_ffmpeg,
+                                          sightings=sightings, source=f"{timestamp}_{safe_fname}")
+        except ValueError as e:
+            print(f"[recognize_video] Could not open video: {input_path}: {e}")
+            raise HTTPException(status_code=400, detail="Cannot open input video file")
+        finally:
+            if os.path.exists(input_path):
+                os.remove(input_path)
 
-        # Try re-encoding to a more compatible codec container for web browsers (H264)
-        try_reencode = True
-        if try_reencode:
-            try:
-                reencoded_path = f"{output_path}.re.mp4"
-                print(f"Attempting re-encode to H264-like fourcc for better browser compatibility: {reencoded_path}")
-                cap_re = cv2.VideoCapture(output_path)
-                if cap_re.isOpened():
-                    w = int(cap_re.get(cv2.CAP_PROP_FRAME_WIDTH))
-                    h = int(cap_re.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                    fps_r = int(cap_re.get(cv2.CAP_PROP_FPS)) or fps
-                    codecs_to_try = ["avc1", "H264", "X264", "mp4v"]
-                    reencoded = False
-                    for codec in codecs_to_try:
-                        try:
-                            fourcc_re = cv2.VideoWriter_fourcc(*codec)
-                            out_re = cv2.VideoWriter(reencoded_path, fourcc_re, fps_r, (w, h))
-                            if not out_re.isOpened():
-                                print(f"Codec {codec} didn't open writer")
-                                continue
-                            cap_re.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                            while True:
-                                ret_r, frame_r = cap_re.read()
-                                if not ret_r:
-                                    break
-                                out_re.write(frame_r)
-                            out_re.release()
-                            reencoded = True
-                            print(f"Re-encoding succeeded with codec {codec}")
-                            break
-                        except Exception as e:
-                            print(f"Re-encode attempt with {codec} failed: {e}")
-                    cap_re.release()
-                    if reencoded and os.path.exists(reencoded_path):
-                        os.replace(reencoded_path, output_path)
-                        print(f"Reencoded file replaced the output: {output_path}")
-                    else:
-                        if os.path.exists(reencoded_path):
-                            os.remove(reencoded_path)
-            except Exception as e:
-                print(f"Error during optional re-encoding: {e}")
-        
-        recognized_list = [{"name": n, "count": v["count"], "wanted": v.get("wanted", False)} for n, v in people_found.items()]
+        file_size = 0
+        if output_path is not None:
+            if not os.path.exists(output_path):
+                raise Exception("Video file was not created")
+
+            file_size = os.path.getsize(output_path)
+            if file_size == 0:
+                raise Exception("Video file is empty")
+
+            print(f"Video created successfully: {output_path}, size: {file_size} bytes")
+            artifacts.register(output_path)
+
+        people_found = processed["people_found"]
+        recognized_list = [
+            {"name": n, "count": v["count"], "wanted": v.get("wanted", False), "appearances": v.get("appearances", 0)}
+            for n, v in people_found.items()
+        ]
 
         return {
             "status": "success",
-            "total_frames": frame_count,
+            "total_frames": processed["total_frames"],
             "recognized_faces": recognized_list,
-            "total_recognized": recognized_count,
-            "video_url": f"/api/video/{timestamp}",
-            "video_static_url": f"/uploaded_files/{os.path.basename(output_path)}",
-            "file_size": file_size
+            "total_recognized": processed["total_recognized"],
+            "video_url": f"/api/video/{timestamp}" if output_path else None,
+            "video_static_url": f"/uploaded_files/{os.path.basename(output_path)}" if output_path else None,
+            "file_size": file_size,
+            "embedding_stats": summarize_embedding_stats(processed["embedding_stats"]),
+            "segments": processed.get("segments", 1)
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Video processing error: {e}")
         import traceback
@@ -334,17 +332,20 @@ async def webcam_stream():
 
         try:
             frame_count = 0
+            tracker = FaceTracker()
+            raw = None
+            frame = np.empty((480, 640, 3), dtype=np.uint8)
             while webcam_active:
-                ret, frame = cap.read()
+                ret, raw = cap.read(raw)
                 if not ret:
                     print("[webcam_stream] No frame received from camera")
                     break
 
-                frame = cv2.resize(frame, (640, 480))
+                cv2.resize(raw, (640, 480), dst=frame)
 
                 if frame_count % 2 == 0:
-                    results = recognizer.detect_and_recognize_faces(frame)
-                    frame = recognizer.draw_results(frame, results)
+                    results = recognizer.detect_and_recognize_faces(frame, tracker=tracker)
+                    recognizer.draw_results(frame, results, in_place=True)
 
                 _, buffer = cv2.imencode('.jpg', frame)
                 frame_bytes = buffer.tobytes()
@@ -391,6 +392,102 @@ async def webcam_status():
         return {"available": False}
 
 
+@app.get("/api/sightings")
+async def get_sightings(name: Optional[str] = None, source: Optional[str] = None,
+                        since: Optional[float] = None, until: Optional[float] = None, limit: int = 500):
+    """
+    Where has a person appeared: filter by `name` (identity, with `since`/`until` as
+    processing time) or list one `source` (with `since`/`until` as position in seconds).
+    """
+    if name:
+        rows = sightings.find_by_identity(name, since, until, limit)
+    elif source:
+        rows = sightings.find_by_source(source, since, until, limit)
+    else:
+        raise HTTPException(status_code=400, detail="Provide 'name' or 'source'")
+    return {"sightings": rows, "count": len(rows)}
+
+
+@app.post("/api/retro-match")
+async def retro_match(name: str = Form(...)):
+    encodings = db.get_encodings(name)
+    if len(encodings) == 0:
+        return {"status": "error", "message": f"No matching name {name} found"}
+    wanted = any(e["wanted"] for e in db.get_all_names() if e["name"] == name)
+    matched = sightings.retro_match(name, encodings, wanted, recognizer.tolerance, db.model_name)
+    return {"status": "success", "retro_matches": matched}
+
+
+@app.get("/api/unknown-clusters")
+async def get_unknown_clusters(min_count: int = 1):
+    clusters = recognizer.unknown_clusters.list_clusters(min_count)
+    return {"clusters": clusters, "count": len(clusters), "stats": recognizer.unknown_clusters.stats}
+
+
+@app.post("/api/enroll-cluster")
+async def enroll_cluster(cluster_id: int = Form(...), name: str = Form(...), wanted: bool = Form(False)):
+    """Enroll every sample of a recurring unknown face as `name` in one batch."""
+    encodings = recognizer.unknown_clusters.export_cluster(cluster_id)
+    if not encodings:
+        return {"status": "error", "message": f"No unknown cluster {cluster_id}"}
+    added = db.add_encodings(name, encodings, wanted)
+    recognizer.unknown_clusters.remove(cluster_id)
+    retro_matches = sightings.retro_match(name, encodings, wanted, recognizer.tolerance, db.model_name)
+    return {"status": "success", "message": f"Enrolled {added} samples as '{name}'",
+            "added": added, "retro_matches": retro_matches}
+
+
+@app.post("/api/migrate-model")
+async def migrate_model(model_name: str = Form(...), activate: bool = Form(False)):
+    """
+    Re-embed the gallery's stored crops with `model_name` in the background while
+    recognition keeps using the current model. With `activate`, switch to the new
+    gallery once every row has been migrated; a migration that left rows behind (e.g.
+    enrolled before crops were stored) ends "incomplete" and keeps the current model.
+    """
+    global migration
+    if migration is not None and migration.running:
+        return {"status": "error", "message": "A migration is already running", "migration": migration.status()}
+    if model_name == db.model_name:
+        return {"status": "error", "message": f"The gallery already uses {model_name}"}
+    target = get_gallery(model_name)
+
+    def on_complete(done: GalleryMigration):
+        global db
+        db = done.target
+        recognizer.set_database(db)
+        save_model_settings()
+        print(f"[migrate-model] Now matching with {db.model_name}")
+
+    migration = GalleryMigration(db, target, on_complete=on_complete if activate else None).start()
+    return {"status": "success", "migration": migration.status()}
+
+
+@app.get("/api/migration-status")
+async def migration_status():
+    if migration is None:
+        return {"state": "idle"}
+    return migration.status()
+
+
+@app.post("/api/confirm-model")
+async def confirm_model(model_name: str = Form("")):
+    """
+    Screen faces with the active model and confirm candidate matches with `model_name`
+    (its gallery is filled by /api/migrate-model). An empty name turns confirmation off.
+    """
+    if not model_name:
+        recognizer.set_confirm_database(None)
+        save_model_settings()
+        return {"status": "success", "confirm_model": None}
+    if model_name == db.model_name:
+        return {"status": "error", "message": f"{model_name} is already the screening model"}
+    gallery = get_gallery(model_name)
+    recognizer.set_confirm_database(gallery)
+    save_model_settings()
+    return {"status": "success", "confirm_model": model_name, "confirm_gallery_size": len(gallery.known_names)}
+
+
 @app.get("/api/known-faces")
 async def get_known_faces():
     known = db.get_all_names()
@@ -406,6 +503,11 @@ async def set_wanted(name: str = Form(...), wanted: str = Form(...)):
         else:
             wanted_bool = bool(wanted)
         updated = db.set_wanted(name, wanted_bool)
+        for gallery in list(galleries.values()):
+            if gallery is not db:
+                gallery.set_wanted(name, wanted_bool)
+        if updated:
+            sightings.set_wanted(name, wanted_bool)
         if updated:
             return {"status": "success", "message": f"Updated wanted status for {name}"}
         else:
@@ -417,74 +519,46 @@ async def set_wanted(name: str = Form(...), wanted: str = Form(...)):
 
 @app.get("/api/list-videos")
 async def list_videos():
-    files = [f for f in os.listdir("uploaded_files") if f.endswith("_output.mp4")]
+    files = artifacts.list()
     return {"videos": files, "count": len(files)}
 
 
 @app.post("/api/clear-database")
 async def clear_database():
-    db.known_encodings = []
-    db.known_names = []
-    db.known_wanted = []
-    db.save_database()
+    if migration is not None:
+        migration.stop()
+    for gallery in list(galleries.values()):
+        gallery.clear()
     return {"status": "success", "message": "Database cleared"}
 
 
 @app.get("/api/video/{video_id}")
-async def get_video(video_id: str, range: Optional[str] = Header(None)):
+async def get_video(
+    video_id: str,
+    range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None)
+):
     try:
-        video_path = None
-        for file in os.listdir("uploaded_files"):
-            if video_id in file and "_output.mp4" in file:
-                video_path = os.path.join("uploaded_files", file)
-                break
-        
-        if not video_path or not os.path.exists(video_path):
+        video_path = artifacts.resolve(video_id)
+        if video_path is None:
             print(f"Video not found for ID: {video_id}")
-            print(f"Files in uploaded_files: {os.listdir('uploaded_files')}")
             raise HTTPException(status_code=404, detail="Video not found")
-        
-        print(f"Serving video: {video_path}")
-        print(f"Range Header: {range}")
-        
-        file_size = os.path.getsize(video_path)
-        print(f"Video file_size: {file_size}")
-        
-        if range:
-            try:
-                range_val = range.strip().lower()
-                if range_val.startswith("bytes="):
-                    range_val = range_val.replace("bytes=", "")
-                start_str, end_str = range_val.split("-")
-                start = int(start_str) if start_str else 0
-                end = int(end_str) if end_str else file_size - 1
-                end = min(end, file_size - 1)
-                if start > end:
-                    return Response(status_code=416)
-
-                length = end - start + 1
-                with open(video_path, "rb") as f:
-                    f.seek(start)
-                    data = f.read(length)
-
-                headers = {
-                    "Content-Range": f"bytes {start}-{end}/{file_size}",
-                    "Accept-Ranges": "bytes",
-                    "Content-Length": str(length),
-                    "Content-Disposition": f"inline; filename={os.path.basename(video_path)}",
-                }
-                return Response(content=data, status_code=206, media_type="video/mp4", headers=headers)
-            except Exception as e:
-                print(f"Range processing error: {e}")
-                # fall back to sending entire file
 
+        validators = file_validators(video_path)
+        if is_not_modified(validators, if_none_match, if_modified_since):
+            return Response(status_code=304, headers=validators)
+
+        print(f"Serving video: {video_path} (Range: {range})")
+        # FileResponse streams in chunks (or hands the path to the server for sendfile)
+        # and answers Range / If-Range requests itself, so nothing is buffered here.
         return FileResponse(
             path=video_path,
             media_type="video/mp4",
-            filename=os.path.basename(video_path),
             headers={
-                "Content-Disposition": f"inline; filename={os.path.basename(video_path)}",
+                "Content-Disposition": f"inline; filename={video_path.name}",
                 "Accept-Ranges": "bytes",
+                **validators,
             }
         )
     except HTTPException:
@@ -504,7 +578,7 @@ async def health_check():
 
         # Known faces and DB
         known_faces = len(db.get_all_names())
-        database_loaded = len(db.known_encodings) > 0
+        database_loaded = len(db.known_names) > 0
 
         # faces.pt presence
         faces_pt_exists = os.path.exists("faces.pt")
@@ -588,6 +662,12 @@ async def health_check():
             "disk_free_gb": disk_free_gb,
             "webcam_available": webcam_ok,
             "uptime_seconds": uptime_seconds,
+            "embedding_stats": recognizer.get_embedding_stats(),
+            "gallery_memory": db.memory_usage(),
+            "unknown_cluster_stats": recognizer.unknown_clusters.stats,
+            "model_name": recognizer.model_name,
+            "confirm_model": recognizer.confirm_database.model_name if recognizer.confirm_database else None,
+            "galleries": {m: len(g.known_names) for m, g in galleries.items()},
             "platform": platform.platform(),
             "simple": simple,
         }
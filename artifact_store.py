@@ -0,0 +1,120 @@
+import asyncio
+import os
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class ArtifactStore:
+    """
+    Index of generated output files (annotated videos) kept in memory, so lookups don't
+    list the directory. The directory is scanned once at startup and every new output
+    is registered when it's written.
+
+    `sweep()` enforces retention: outputs older than `max_age_seconds` are removed, then
+    the oldest ones until the total size fits in `max_total_bytes`.
+    """
+
+    def __init__(self, root: str = "uploaded_files", suffix: str = "_output.mp4",
+                 max_age_seconds: float = 7 * 24 * 3600, max_total_bytes: int = 10 * 1024 ** 3):
+        self.root = Path(root)
+        self.root.mkdir(exist_ok=True)
+        self.suffix = suffix
+        self.max_age_seconds = max_age_seconds
+        self.max_total_bytes = max_total_bytes
+        self._index = {}
+        self._lock = threading.Lock()
+        self.rescan()
+
+    def rescan(self):
+        index = {}
+        for entry in os.scandir(self.root):
+            if entry.is_file() and entry.name.endswith(self.suffix):
+                index[entry.name[:-len(self.suffix)]] = Path(entry.path)
+        with self._lock:
+            self._index = index
+
+    def register(self, path: str) -> str:
+        path = Path(path)
+        artifact_id = path.name[:-len(self.suffix)] if path.name.endswith(self.suffix) else path.stem
+        with self._lock:
+            self._index[artifact_id] = path
+        return artifact_id
+
+    def resolve(self, artifact_id: str) -> Optional[Path]:
+        with self._lock:
+            path = self._index.get(artifact_id)
+            if path is None:
+                # Older links used a partial id; match it against the index, not the disk
+                path = next((p for k, p in self._index.items() if artifact_id in k), None)
+        if path is not None and not path.exists():
+            self.remove(artifact_id)
+            return None
+        return path
+
+    def list(self) -> List[str]:
+        with self._lock:
+            return sorted(p.name for p in self._index.values())
+
+    def remove(self, artifact_id: str):
+        with self._lock:
+            path = self._index.pop(artifact_id, None)
+        if path is not None and path.exists():
+            path.unlink()
+
+    def sweep(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            items = list(self._index.items())
+        entries = []
+        for artifact_id, path in items:
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                with self._lock:
+                    self._index.pop(artifact_id, None)
+                continue
+            entries.append((st.st_mtime, st.st_size, artifact_id))
+
+        removed = []
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, artifact_id in entries:
+            if now - mtime > self.max_age_seconds or total > self.max_total_bytes:
+                self.remove(artifact_id)
+                removed.append(artifact_id)
+                total -= size
+        if removed:
+            print(f"[artifact_store] Retention sweep removed {len(removed)} outputs, {total} bytes kept")
+        return {"removed": removed, "total_bytes": total}
+
+    async def run_sweeper(self, interval_seconds: float = 3600.0):
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                print(f"[artifact_store] Sweep error: {e}")
+            await asyncio.sleep(interval_seconds)
+
+
+def file_validators(path: Path) -> Dict[str, str]:
+    """ETag and Last-Modified headers for a file, derived from its size and mtime."""
+    st = path.stat()
+    return {
+        "ETag": f'"{st.st_size:x}-{st.st_mtime_ns:x}"',
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+    }
+
+
+def is_not_modified(validators: Dict[str, str], if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+    if if_none_match is not None:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or validators["ETag"] in tags
+    if if_modified_since is not None:
+        try:
+            return parsedate_to_datetime(validators["Last-Modified"]) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
@@ -0,0 +1,158 @@
+"""
+Allocation profile of the video loop (`process_video`) in steady state.
+
+The YOLO detector and the DeepFace embedding are replaced by cheap stubs, so what is
+measured is the pipeline itself: decode, quality gate, tracking, matching, drawing and
+encode. A synthetic clip with one textured "face" is generated, and tracemalloc records,
+for every frame after warm-up, how many bytes were allocated on top of what was live
+when the frame was read (transient), and how much stays allocated at the end (retained).
+
+    python benchmarks/frame_allocations.py [--frames 300] [--detect-every 5] [--opencv]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+from unittest import mock
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import face_processor  # noqa: E402
+import video_processor  # noqa: E402
+from face_processor import FaceDatabase, FaceRecognizer  # noqa: E402
+
+WIDTH, HEIGHT = 640, 480
+FACE_BOX = (240, 140, 400, 340)
+
+
+class _Array:
+    """Just enough of a torch tensor for `detect_and_recognize_faces`."""
+
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=np.float32)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class _Boxes:
+    def __init__(self, boxes, confidences):
+        self.xyxy = _Array(boxes)
+        self.conf = _Array(confidences)
+
+    def __len__(self):
+        return len(self.conf.values)
+
+
+class _Result:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class StubDetector:
+    """Always reports the synthetic face; allocates about what unpacking real results does."""
+
+    def __init__(self, model_path=None):
+        pass
+
+    def __call__(self, image, conf=0.5):
+        return [_Result(_Boxes([FACE_BOX], [0.9]))]
+
+
+def stub_represent(img_path=None, model_name=None, enforce_detection=False):
+    rng = np.random.default_rng(0)
+    return [{"embedding": rng.normal(size=128).tolist()}]
+
+
+def write_clip(path: str, frames: int, fps: float = 25.0):
+    rng = np.random.default_rng(1)
+    background = rng.integers(0, 255, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+    face = rng.integers(0, 255, (FACE_BOX[3] - FACE_BOX[1], FACE_BOX[2] - FACE_BOX[0], 3), dtype=np.uint8)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (WIDTH, HEIGHT))
+    for i in range(frames):
+        frame = np.roll(background, i, axis=1)
+        frame[FACE_BOX[1]:FACE_BOX[3], FACE_BOX[0]:FACE_BOX[2]] = face
+        writer.write(frame)
+    writer.release()
+
+
+def instrumented(reader_cls, samples, warmup):
+    """Reader subclass that records tracemalloc figures between consecutive reads."""
+
+    class Reader(reader_cls):
+        def read(self):
+            current, peak = tracemalloc.get_traced_memory()
+            samples["reads"] += 1
+            if samples["reads"] > warmup + 1:
+                samples["transient"].append(peak - samples["last"])
+            elif samples["reads"] == warmup + 1:
+                samples["start"] = current
+            samples["end"] = current
+            tracemalloc.reset_peak()
+            ret, frame = super().read()
+            samples["last"] = tracemalloc.get_traced_memory()[0]
+            return ret, frame
+
+    return Reader
+
+
+def run(frames: int, detect_every: int, use_ffmpeg: bool, warmup: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        clip = os.path.join(tmp, "clip.mp4")
+        write_clip(clip, frames)
+        with mock.patch("ultralytics.YOLO", StubDetector), \
+                mock.patch.object(face_processor.DeepFace, "represent", stub_represent):
+            database = FaceDatabase(os.path.join(tmp, "faces"))
+            database.add_encodings("someone", [stub_represent()[0]["embedding"]])
+            recognizer = FaceRecognizer(database=database)
+
+            samples = {"reads": 0, "transient": [], "last": 0, "start": 0, "end": 0}
+            patches = [
+                mock.patch.object(video_processor, "FFmpegReader", instrumented(video_processor.FFmpegReader, samples, warmup)),
+                mock.patch.object(video_processor, "OpenCVReader", instrumented(video_processor.OpenCVReader, samples, warmup)),
+            ]
+            for p in patches:
+                p.start()
+            tracemalloc.start()
+            try:
+                video_processor.process_video(recognizer, clip, os.path.join(tmp, "out.mp4"),
+                                              detect_every, use_ffmpeg=use_ffmpeg)
+            finally:
+                tracemalloc.stop()
+                for p in patches:
+                    p.stop()
+
+    transient = np.array(samples["transient"], dtype=np.float64)
+    measured = len(transient)
+    frame_bytes = WIDTH * HEIGHT * 3
+    print(f"reader: {'ffmpeg' if use_ffmpeg else 'opencv'}, frames measured: {measured} "
+          f"(after {warmup} warm-up), detect every {detect_every}")
+    if measured == 0:
+        return
+    print(f"transient bytes/frame: median {np.median(transient):,.0f}  p95 {np.percentile(transient, 95):,.0f}  "
+          f"max {transient.max():,.0f}  (one frame = {frame_bytes:,} bytes)")
+    print(f"median transient / frame size: {np.median(transient) / frame_bytes:.3f}")
+    print(f"retained growth: {(samples['end'] - samples['start']) / measured:,.1f} bytes/frame")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--detect-every", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=30)
+    parser.add_argument("--opencv", action="store_true", help="Use the OpenCV reader/writer even if ffmpeg is available")
+    args = parser.parse_args()
+    use_ffmpeg = video_processor.ffmpeg_available() and not args.opencv
+    run(args.frames, args.detect_every, use_ffmpeg, args.warmup)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Gallery storage benchmark: memory, checkpoint cost, match latency and accuracy of the
+float32 / float16 / int8 / pq storage modes of FaceDatabase on a synthetic gallery,
+compared with the original per-row `compare_with_database` loop.
+
+The gallery is seeded as an existing float32 checkpoint, opened with each storage mode,
+grown by `--append` rows and checkpointed again (the timed, traced checkpoint), then
+reopened (the timed, traced load).
+
+Identities are random unit vectors with a few noisy samples each. Half of the queries
+are new noisy views of enrolled people, the other half are strangers. A query's
+decision (name or Unknown at `--tolerance`) is compared with the exact float32 search;
+the original loop is too slow for the full query set and runs on `--legacy-queries`.
+
+    python benchmarks/gallery_storage.py [--rows 50000] [--dim 128] [--queries 500] [--append 1000]
+"""
+import argparse
+import pickle
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from face_processor import LEGACY_MODEL_NAME, FaceDatabase, GallerySnapshot  # noqa: E402
+
+SAMPLES_PER_PERSON = 5
+
+
+def unit(x: np.ndarray) -> np.ndarray:
+    return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+
+def make_data(rows: int, dim: int, queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    people = rows // SAMPLES_PER_PERSON
+    centers = unit(rng.normal(size=(people, dim)))
+    noise = 0.5 / np.sqrt(dim)
+    gallery = unit(np.repeat(centers, SAMPLES_PER_PERSON, axis=0) + rng.normal(scale=noise, size=(rows, dim)))
+    names = [f"person{i // SAMPLES_PER_PERSON}" for i in range(rows)]
+    known = centers[rng.integers(0, people, queries // 2)]
+    strangers = unit(rng.normal(size=(queries - len(known), dim)))
+    query = unit(np.vstack([known, strangers]) + rng.normal(scale=0.6 / np.sqrt(dim), size=(queries, dim)))
+    return gallery.astype(np.float32), names, query.astype(np.float32)
+
+
+def legacy_compare(encodings, names, encoding, tolerance):
+    """The original FaceRecognizer.compare_with_database: one cosine distance per stored row."""
+    distances = []
+    for db_enc in encodings:
+        db_e = np.array(db_enc).astype(np.float64)
+        enc = np.array(encoding).astype(np.float64)
+        norm_prod = np.linalg.norm(db_e) * np.linalg.norm(enc)
+        if norm_prod == 0:
+            distances.append(np.inf)
+            continue
+        distances.append(1 - np.dot(db_e, enc) / norm_prod)
+    distances = np.array(distances)
+    i = int(np.argmin(distances))
+    return names[i] if distances[i] < tolerance else "Unknown"
+
+
+def match(snap: GallerySnapshot, query: np.ndarray, tolerance: float, rerank_k: int) -> str:
+    """What FaceRecognizer.compare_with_database decides for a unit query."""
+    i, distance = snap.nearest(query, rerank_k)
+    return snap.names[i] if distance < tolerance else "Unknown"
+
+
+def seed_checkpoint(directory, gallery, names):
+    """Write a float32 checkpoint in FaceDatabase's on-disk format, as an existing gallery would have."""
+    model_dir = Path(directory) / LEGACY_MODEL_NAME
+    model_dir.mkdir(parents=True)
+    with open(model_dir / "encodings.pkl", "wb") as f:
+        pickle.dump({"encodings": gallery, "names": names, "wanted": [False] * len(names),
+                     "face_ids": [None] * len(names), "model_name": LEGACY_MODEL_NAME, "generation": 0}, f)
+
+
+def run_mode(storage, gallery, names, queries, tolerance, rerank_k, append, directory):
+    seed = len(gallery) - append
+    seed_checkpoint(directory, gallery[:seed], names[:seed])
+    db = FaceDatabase(directory, storage=storage, checkpoint_every=10 ** 9, rerank_k=rerank_k)
+    for i in range(seed, len(gallery), SAMPLES_PER_PERSON):
+        db.add_encodings(names[i], gallery[i:i + SAMPLES_PER_PERSON])
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    db.save_database()
+    checkpoint_seconds = time.perf_counter() - started
+    checkpoint_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    reloaded = FaceDatabase(directory, storage=storage, rerank_k=rerank_k)
+    load_seconds = time.perf_counter() - started
+    load_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    snap = reloaded.snapshot()
+    started = time.perf_counter()
+    decisions = [match(snap, q, tolerance, rerank_k) for q in queries]
+    latency = (time.perf_counter() - started) / len(queries)
+    usage = reloaded.memory_usage()
+    return {
+        "storage": storage,
+        "resident_mb": (usage["index_bytes"] + usage["resident_vector_bytes"]) / 1e6,
+        "mapped_mb": usage["mapped_vector_bytes"] / 1e6,
+        "checkpoint_s": checkpoint_seconds,
+        "checkpoint_peak_mb": checkpoint_peak / 1e6,
+        "load_s": load_seconds,
+        "load_peak_mb": load_peak / 1e6,
+        "latency_ms": latency * 1000,
+        "decisions": decisions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--append", type=int, default=1000,
+                        help="rows added between opening the seeded gallery and the timed checkpoint")
+    parser.add_argument("--legacy-queries", type=int, default=20)
+    parser.add_argument("--tolerance", type=float, default=0.4)
+    parser.add_argument("--rerank-k", type=int, default=32)
+    args = parser.parse_args()
+
+    gallery, names, queries = make_data(args.rows, args.dim, args.queries)
+    append = args.append // SAMPLES_PER_PERSON * SAMPLES_PER_PERSON
+    print(f"{args.rows} rows x {args.dim} dims ({append} appended before the checkpoint), "
+          f"{args.queries} queries, tolerance {args.tolerance}")
+
+    results = []
+    for storage in ["float32", "float16", "int8", "pq"]:
+        with tempfile.TemporaryDirectory() as tmp:
+            results.append(run_mode(storage, gallery, names, queries, args.tolerance, args.rerank_k, append, tmp))
+    exact = results[0]["decisions"]
+
+    # The original list-of-arrays loop, on a subset of the queries
+    legacy_list = list(gallery.astype(np.float64))
+    subset = queries[:args.legacy_queries]
+    started = time.perf_counter()
+    legacy = [legacy_compare(legacy_list, names, q, args.tolerance) for q in subset]
+    legacy_ms = (time.perf_counter() - started) / len(subset) * 1000
+    legacy_agree = np.mean([a == b for a, b in zip(legacy, exact)])
+    legacy_mb = sum(a.nbytes + 112 for a in legacy_list) / 1e6
+
+    header = f"{'storage':<9}{'resident MB':>12}{'mapped MB':>11}{'ckpt s':>8}{'ckpt peak MB':>14}" \
+             f"{'load s':>8}{'load peak MB':>14}{'match ms':>10}{'agree':>8}"
+    print(header)
+    print(f"{'original':<9}{legacy_mb:>12.1f}{0:>11.1f}{'-':>8}{'-':>14}{'-':>8}{'-':>14}{legacy_ms:>10.2f}"
+          f"{legacy_agree:>8.1%}")
+    for r in results:
+        agree = np.mean([a == b for a, b in zip(r["decisions"], exact)])
+        print(f"{r['storage']:<9}{r['resident_mb']:>12.1f}{r['mapped_mb']:>11.1f}{r['checkpoint_s']:>8.2f}"
+              f"{r['checkpoint_peak_mb']:>14.1f}{r['load_s']:>8.2f}{r['load_peak_mb']:>14.1f}"
+              f"{r['latency_ms']:>10.2f}{agree:>8.1%}")
+    print(f"(original: list of float64 arrays, {len(subset)} queries; agreement is with exact float32)")
+
+
+if __name__ == "__main__":
+    main()
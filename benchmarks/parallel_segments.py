@@ -0,0 +1,170 @@
+"""
+Wall-clock scaling of `process_video_parallel` with the number of worker processes.
+
+Runs the same video with each `--workers` value and reports the time and the speedup
+over one worker. With `--uncapped`, every multi-worker run is repeated with each worker
+given a thread pool per core (the behaviour before per-worker thread caps), to show
+what oversubscription costs. Worker counts above the core count are capped by
+`process_video_parallel`, so the number of segments actually used is printed too.
+
+By default the real YOLO weights (`--model`) and DeepFace are used. `--stub` replaces
+them with CPU-bound stand-ins (BLAS matrix products and OpenCV filters sized like a
+small model), so the script also runs where the models aren't installed.
+
+    python benchmarks/parallel_segments.py [--video clip.mp4 | --seconds 60] [--workers 1,2,4] [--stub] [--uncapped]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import face_processor  # noqa: E402
+import video_processor  # noqa: E402
+from face_processor import FaceDatabase, FaceRecognizer  # noqa: E402
+
+WIDTH, HEIGHT = 640, 360
+FACE_BOX = (240, 100, 360, 250)
+STUB_MATMULS = 12
+
+
+class _Array:
+    """Just enough of a torch tensor for `detect_and_recognize_faces`."""
+
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=np.float32)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class _Boxes:
+    def __init__(self, boxes, confidences):
+        self.xyxy = _Array(boxes)
+        self.conf = _Array(confidences)
+
+    def __len__(self):
+        return len(self.conf.values)
+
+
+class _Result:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class StubDetector:
+    """Reports the synthetic face after some multi-threaded OpenCV work on the frame."""
+
+    def __init__(self, model_path=None):
+        pass
+
+    def __call__(self, image, conf=0.5):
+        small = cv2.resize(image, (320, 320))
+        for _ in range(4):
+            small = cv2.GaussianBlur(small, (9, 9), 0)
+        return [_Result(_Boxes([FACE_BOX], [0.9]))]
+
+
+def stub_represent(img_path=None, model_name=None, enforce_detection=False):
+    """An embedding costing a few BLAS-threaded matrix products, deterministic per crop."""
+    a = np.random.default_rng(int(np.asarray(img_path).sum()) % 1000).normal(size=(256, 256))
+    for _ in range(STUB_MATMULS):
+        a = np.tanh(a @ a / 16.0)
+    return [{"embedding": a[0, :128].tolist()}]
+
+
+def install_stubs():
+    import ultralytics
+    ultralytics.YOLO = StubDetector
+    face_processor.DeepFace.represent = stub_represent
+
+
+def stub_init_worker(*args):
+    """Worker initializer: runs in a fresh spawned process, where `_init_worker` is unpatched."""
+    install_stubs()
+    video_processor._init_worker(*args)
+
+
+def write_clip(path: str, seconds: float, fps: float = 25.0):
+    rng = np.random.default_rng(1)
+    background = rng.integers(0, 255, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (WIDTH, HEIGHT))
+    for i in range(int(seconds * fps)):
+        frame = np.roll(background, i, axis=1)
+        # A new "face" every second, so crops (and stub embeddings) change
+        face = np.random.default_rng(i // int(fps)).integers(
+            0, 255, (FACE_BOX[3] - FACE_BOX[1], FACE_BOX[2] - FACE_BOX[0], 3), dtype=np.uint8)
+        frame[FACE_BOX[1]:FACE_BOX[3], FACE_BOX[0]:FACE_BOX[2]] = face
+        writer.write(frame)
+    writer.release()
+
+
+def timed(recognizer, video, output, workers, threads):
+    started = time.perf_counter()
+    result = video_processor.process_video_parallel(recognizer, video, output, workers,
+                                                    threads_per_worker=threads)
+    return time.perf_counter() - started, result["segments"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--video", help="Video to process (default: a synthetic clip)")
+    parser.add_argument("--seconds", type=float, default=60.0, help="Length of the synthetic clip")
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--model", default="faces.pt")
+    parser.add_argument("--stub", action="store_true", help="Use CPU-bound stand-ins for YOLO and DeepFace")
+    parser.add_argument("--uncapped", action="store_true",
+                        help="Also run each multi-worker case with one thread per core in every worker")
+    parser.add_argument("--no-annotate", action="store_true", help="Only analyze, don't write a video")
+    args = parser.parse_args()
+    if not video_processor.ffmpeg_available():
+        sys.exit("process_video_parallel needs ffmpeg and ffprobe on PATH")
+
+    cores = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as tmp:
+        video = args.video
+        if video is None:
+            video = os.path.join(tmp, "clip.mp4")
+            write_clip(video, args.seconds)
+        output = None if args.no_annotate else os.path.join(tmp, "out.mp4")
+
+        patches = []
+        if args.stub:
+            install_stubs()
+            patches.append(mock.patch.object(video_processor, "_init_worker", stub_init_worker))
+        for p in patches:
+            p.start()
+        try:
+            database = FaceDatabase(os.path.join(tmp, "faces"))
+            recognizer = FaceRecognizer(args.model, database=database)
+            runs = []
+            for workers in [int(w) for w in args.workers.split(",")]:
+                seconds, segments = timed(recognizer, video, output, workers, None)
+                runs.append((workers, segments, "capped", seconds))
+                if args.uncapped and segments > 1:
+                    seconds, segments = timed(recognizer, video, output, workers, cores)
+                    runs.append((workers, segments, "uncapped", seconds))
+        finally:
+            for p in patches:
+                p.stop()
+
+    baseline = next(s for w, n, mode, s in runs if n == 1)
+    print(f"{video}: {cores} cores, {'stub' if args.stub else 'real'} models")
+    print(f"{'workers':>8}{'segments':>10}{'threads':>10}{'seconds':>10}{'speedup':>9}")
+    for workers, segments, mode, seconds in runs:
+        threads = cores if mode == "uncapped" else max(1, cores // segments)
+        print(f"{workers:>8}{segments:>10}{threads:>10}{seconds:>10.2f}{baseline / seconds:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,21 +3,278 @@ import numpy as np
 import cv2
 from deepface import DeepFace
 from pathlib import Path
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
 import pickle
+import time
+import threading
+import struct
+import uuid
+import zlib
+
+from gallery_index import BLOCK_ROWS, INDEX_TYPES, build_index
+
+# Identity reported for a face whose crop failed the quality gate and couldn't be
+# identified: unlike "Unknown", it was never compared with the gallery
+LOW_QUALITY = "low_quality"
+
+# Galleries saved before per-model namespaces were always embedded with Facenet
+LEGACY_MODEL_NAME = "Facenet"
+
+# Cosine-distance thresholds DeepFace uses to verify two faces with each model
+MODEL_TOLERANCES = {
+    "Facenet": 0.40,
+    "Facenet512": 0.30,
+    "ArcFace": 0.68,
+    "VGG-Face": 0.68,
+    "SFace": 0.593,
+    "OpenFace": 0.10,
+    "DeepFace": 0.23,
+    "DeepID": 0.015,
+    "GhostFaceNet": 0.65,
+    "Dlib": 0.07,
+}
+
+
+def model_tolerance(model_name: str) -> float:
+    return MODEL_TOLERANCES.get(model_name, 0.4)
+
+
+def to_unit_rows(encodings) -> np.ndarray:
+    """Stack embeddings into float32 unit-norm rows; zero vectors stay zero."""
+    matrix = np.array(encodings, dtype=np.float32)
+    if matrix.size == 0:
+        return np.empty((0, 0), dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class GallerySnapshot:
+    """
+    Immutable view of the gallery at one version. A lookup holds one snapshot from
+    start to finish, so names and wanted flags always line up with the rows it
+    searched, whatever writers do meanwhile.
+
+    Embeddings are float32 unit rows: `base` followed by `tail`. With the default
+    float32 storage everything lives in `base` in RAM. With a compact `index`,
+    `base` is memory-mapped from disk and `tail` holds rows added since the last
+    checkpoint. Search scans the compact codes, then re-ranks the best candidates
+    exactly against the float32 rows.
+
+    `epoch` counts clears: snapshots of the same epoch only ever grew by appending rows,
+    so the rows of an older one are a prefix of a newer one.
+    """
+
+    __slots__ = ("names", "wanted", "face_ids", "version", "base", "tail", "index", "epoch")
+
+    def __init__(self, names: tuple = (), wanted: tuple = (), version: int = 0,
+                 base: np.ndarray = None, tail: np.ndarray = None, index=None, face_ids: tuple = None,
+                 epoch: int = 0):
+        self.epoch = epoch
+        self.names = names
+        self.wanted = wanted
+        # Id of the stored enrollment crop behind each row (None for rows without one)
+        self.face_ids = face_ids if face_ids is not None else (None,) * len(names)
+        self.version = version
+        self.base = base if base is not None else np.empty((0, 0), dtype=np.float32)
+        self.tail = tail if tail is not None else np.empty((0, self.base.shape[1]), dtype=np.float32)
+        self.index = index
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def dim(self) -> int:
+        return self.base.shape[1] if len(self.base) else self.tail.shape[1]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """All rows as one (n, d) float32 array; reads the whole file when memory-mapped."""
+        if len(self.tail) == 0:
+            return np.asarray(self.base)
+        if len(self.base) == 0:
+            return self.tail
+        return np.vstack([self.base, self.tail])
+
+    def rows(self, idx) -> np.ndarray:
+        idx = np.asarray(idx, dtype=np.int64)
+        nb = len(self.base)
+        out = np.empty((len(idx), self.dim), dtype=np.float32)
+        in_base = idx < nb
+        if in_base.any():
+            out[in_base] = self.base[idx[in_base]]
+        if not in_base.all():
+            out[~in_base] = self.tail[idx[~in_base] - nb]
+        return out
+
+    def search(self, query: np.ndarray, k: int = 1, rerank_k: int = 32) -> Tuple[np.ndarray, np.ndarray]:
+        """Indices and cosine distances of the `k` rows closest to the unit vector `query`."""
+        if self.index is None:
+            candidates = np.arange(len(self))
+            exact = self.matrix @ query
+        else:
+            candidates, _ = self.index.search(query, max(k, rerank_k))
+            exact = self.rows(candidates) @ query
+        top = np.argsort(-exact)[:k]
+        return candidates[top], 1 - exact[top]
+
+    def nearest(self, query: np.ndarray, rerank_k: int = 32) -> Tuple[int, float]:
+        """Index and cosine distance of the row closest to the unit vector `query`."""
+        idx, distances = self.search(query, 1, rerank_k)
+        return int(idx[0]), float(distances[0])
 
 
 class FaceDatabase:
-    def __init__(self, database_dir: str = "known_faces", model_name: str = "Facenet"):
-        self.database_dir = Path(database_dir)
-        self.database_dir.mkdir(exist_ok=True)
+    """
+    Known faces, safe to share between request handlers and the webcam loop.
+
+    Readers take `snapshot()` and never block. Writers are serialized, publish a new
+    snapshot and append one record to a write-ahead log (`encodings.wal`). Concurrent
+    writers share a single fsync (group commit). Every `checkpoint_every` records the
+    current snapshot is written to `encodings.pkl` (atomic replace) and the log is
+    truncated. On load the checkpoint is read and the log replayed, stopping at the
+    first torn record. Log records carry the checkpoint generation they follow, so a
+    crash between checkpoint and truncation can't replay them twice.
+
+    `storage` selects the in-memory gallery representation: "float32" (exact, in RAM),
+    or "float16", "int8" or "pq" (product quantization). The compact modes keep only
+    codes in RAM and re-rank the top `rerank_k` candidates exactly against float32 rows
+    memory-mapped from a raw `vectors-<generation>.f32` file, to which each checkpoint
+    appends the rows added since the previous one.
+
+    Each embedding model gets its own namespace (`<database_dir>/<model_name>/`) and
+    checkpoints are tagged with the model, so vectors from different models are never
+    compared. Enrollment crops are kept in `<database_dir>/crops/`, shared by all
+    models, so a gallery can be re-embedded with another model (see GalleryMigration).
+
+    `read_only=True` is for other processes (video workers) reading a gallery that a
+    live process owns: nothing on disk is created, moved, truncated or rewritten, a
+    torn log tail is just ignored, and writes raise.
+    """
+
+    def __init__(self, database_dir: str = "known_faces", model_name: str = "Facenet",
+                 checkpoint_every: int = 256, storage: str = "float32", rerank_k: int = 32,
+                 read_only: bool = False):
+        self.read_only = read_only
+        self.root_dir = Path(database_dir)
+        self.crops_dir = self.root_dir / "crops"
+        self.database_dir = self.root_dir / model_name
+        if not read_only:
+            self.root_dir.mkdir(exist_ok=True)
+            self.crops_dir.mkdir(exist_ok=True)
+            self.database_dir.mkdir(exist_ok=True)
+            self._adopt_legacy_files(model_name)
         self.encodings_file = self.database_dir / "encodings.pkl"
-        self.known_encodings = []
-        self.known_names = []
-        self.known_wanted = []
+        self.wal_file = self.database_dir / "encodings.wal"
         self.model_name = model_name
+        self.checkpoint_every = checkpoint_every
+        if storage not in INDEX_TYPES:
+            raise ValueError(f"Unknown gallery storage '{storage}', expected one of {sorted(INDEX_TYPES)}")
+        self.storage = storage
+        self.rerank_k = rerank_k
+        self._snapshot = GallerySnapshot()
+        # _lock orders state changes; _sync_lock is held by the one thread writing the log
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._wal_buffer = []
+        self._wal_records = 0
+        self._generation = 0
+        self._next_seq = 0
+        self._synced_seq = -1
+        self._wal = None
+        # Raw float32 rows file of compact storage and what the last checkpoint put in it
+        self._vectors_path = None
+        self._vector_rows = 0
+        self._vector_epoch = 0
         self.load_database()
 
+    @property
+    def known_encodings(self) -> np.ndarray:
+        """All stored embeddings as float32 unit rows (materialized in compact modes)."""
+        return self._snapshot.matrix
+
+    @property
+    def known_names(self) -> tuple:
+        return self._snapshot.names
+
+    @property
+    def known_wanted(self) -> tuple:
+        return self._snapshot.wanted
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def snapshot(self) -> GallerySnapshot:
+        return self._snapshot
+
+    def get_encodings(self, name: str) -> np.ndarray:
+        snap = self._snapshot
+        return snap.rows([i for i, n in enumerate(snap.names) if n == name])
+
+    def memory_usage(self) -> Dict:
+        snap = self._snapshot
+        mapped = isinstance(snap.base, np.memmap)
+        return {
+            "storage": self.storage,
+            "rows": len(snap),
+            "index_bytes": snap.index.nbytes if snap.index is not None else 0,
+            "resident_vector_bytes": (0 if mapped else snap.base.nbytes) + snap.tail.nbytes,
+            "mapped_vector_bytes": snap.base.nbytes if mapped else 0,
+        }
+
+    @staticmethod
+    def stored_models(database_dir: str = "known_faces") -> List[str]:
+        """Models with a gallery on disk under `database_dir` (legacy un-namespaced files are Facenet)."""
+        root = Path(database_dir)
+        if not root.is_dir():
+            return []
+        models = [p.name for p in sorted(root.iterdir())
+                  if p.is_dir() and ((p / "encodings.pkl").exists() or (p / "encodings.wal").exists())]
+        if (root / "encodings.pkl").exists() and LEGACY_MODEL_NAME not in models:
+            models.append(LEGACY_MODEL_NAME)
+        return models
+
+    def _adopt_legacy_files(self, model_name: str):
+        """
+        Galleries written before namespaces lived directly in `database_dir` and were
+        always Facenet (the only model this app used). Move them into that namespace.
+        """
+        legacy = self.root_dir / "encodings.pkl"
+        if model_name != LEGACY_MODEL_NAME or not legacy.exists() \
+                or (self.database_dir / "encodings.pkl").exists():
+            return
+        for path in [legacy, self.root_dir / "encodings.wal", *self.root_dir.glob("vectors-*.npy")]:
+            if path.exists():
+                os.replace(path, self.database_dir / path.name)
+        print(f"Moved legacy gallery into {self.database_dir}")
+
+    def save_crop(self, image_array: np.ndarray) -> Optional[str]:
+        """Keep an enrollment crop so the face can be re-embedded later; returns its id."""
+        face_id = uuid.uuid4().hex
+        if cv2.imwrite(str(self.crops_dir / f"{face_id}.png"), image_array):
+            return face_id
+        return None
+
+    def load_crop(self, face_id: str) -> Optional[np.ndarray]:
+        return cv2.imread(str(self.crops_dir / f"{face_id}.png"), cv2.IMREAD_COLOR)
+
+    def embed(self, image_array: np.ndarray) -> Optional[np.ndarray]:
+        """Embedding of a BGR image with this gallery's model, or None."""
+        try:
+            img_rgb = cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB)
+        except Exception:
+            img_rgb = image_array
+
+        embedding = DeepFace.represent(img_path=img_rgb,
+                                       model_name=self.model_name,
+                                       enforce_detection=False)
+        if not embedding:
+            return None
+        return np.array(embedding[0]['embedding'])
+
     def add_face(self, name, image_path=None, image_array=None, wanted=False):
         try:
             embedding = DeepFace.represent(img_path=image_path,
@@ -28,65 +285,330 @@ class FaceDatabase:
                 return False
 
             encoding = np.array(embedding[0]['embedding'])
-            self.known_encodings.append(encoding)
-            self.known_names.append(name)
-            self.known_wanted.append(wanted)
-            self.save_database()
+            image = cv2.imread(str(image_path)) if image_path else None
+            face_id = self.save_crop(image) if image is not None else None
+            self._commit(("add", [(encoding, name, bool(wanted), face_id)]))
             return True
         except Exception as e:
             print(f"Error adding face: {e}")
             return False
 
-    def add_face_from_array(self, image_array: np.ndarray, name: str, wanted: bool = False) -> bool:
+    def add_face_from_array(self, image_array: np.ndarray, name: str, wanted: bool = False,
+                            face_id: str = None) -> bool:
+        """
+        Enroll a face crop. Pass the `face_id` from `save_crop` when the same crop is
+        enrolled in several model galleries; otherwise the crop is saved here.
+        """
         try:
-            try:
-                img_rgb = cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB)
-            except Exception:
-                img_rgb = image_array
-
-            embedding = DeepFace.represent(img_path=img_rgb,
-                                           model_name=self.model_name,
-                                           enforce_detection=False)
-            if not embedding:
+            encoding = self.embed(image_array)
+            if encoding is None:
                 return False
 
-            encoding = np.array(embedding[0]['embedding'])
-            self.known_encodings.append(encoding)
-            self.known_names.append(name)
-            self.known_wanted.append(wanted)
-            self.save_database()
+            if face_id is None:
+                face_id = self.save_crop(image_array)
+            self._commit(("add", [(encoding, name, bool(wanted), face_id)]))
             return True
         except Exception as e:
             print(f"Error adding face: {e}")
             return False
 
-    def save_database(self):
+    def add_encodings(self, name: str, encodings: List[np.ndarray], wanted: bool = False,
+                      face_ids: List[str] = None) -> int:
+        """Enroll several precomputed embeddings for one person as a single log record."""
+        face_ids = face_ids or [None] * len(encodings)
+        rows = [(np.array(e), name, bool(wanted), fid) for e, fid in zip(encodings, face_ids) if e is not None]
+        if rows:
+            self._commit(("add", rows))
+        return len(rows)
+
+    def clear(self):
+        self._commit(("clear",))
+
+    def _apply(self, record: tuple):
+        """Build the snapshot that results from one log record and publish it."""
+        snap = self._snapshot
+        op = record[0]
+        if op == "add":
+            rows = record[1]
+            added = to_unit_rows([row[0] for row in rows])
+            if len(snap) and added.shape[1] != snap.dim:
+                raise ValueError(f"Embedding size {added.shape[1]} doesn't match the gallery ({snap.dim})")
+            names = snap.names + tuple(row[1] for row in rows)
+            wanted = snap.wanted + tuple(bool(row[2]) for row in rows)
+            # Records written before crops were kept have no face id
+            face_ids = snap.face_ids + tuple(row[3] if len(row) > 3 else None for row in rows)
+            if self.storage == "float32":
+                base = np.vstack([snap.base, added]) if len(snap) else added
+                new = GallerySnapshot(names, wanted, snap.version + 1, base=base, face_ids=face_ids,
+                                      epoch=snap.epoch)
+            else:
+                base = snap.base if len(snap) else np.empty((0, added.shape[1]), dtype=np.float32)
+                tail = np.vstack([snap.tail, added]) if len(snap.tail) else added
+                index = snap.index.add(added) if snap.index is not None else build_index(self.storage, added)
+                new = GallerySnapshot(names, wanted, snap.version + 1, base=base, tail=tail, index=index,
+                                      face_ids=face_ids, epoch=snap.epoch)
+        elif op == "set_wanted":
+            _, name, wanted = record
+            new = GallerySnapshot(
+                snap.names,
+                tuple(bool(wanted) if n == name else w for n, w in zip(snap.names, snap.wanted)),
+                snap.version + 1,
+                base=snap.base, tail=snap.tail, index=snap.index, face_ids=snap.face_ids, epoch=snap.epoch,
+            )
+        elif op == "clear":
+            new = GallerySnapshot(version=snap.version + 1, epoch=snap.epoch + 1)
+        else:
+            raise ValueError(f"Unknown database record: {op}")
+        self._snapshot = new
+
+    def _persist_vectors(self, snap: GallerySnapshot, generation: int) -> Path:
+        """
+        Compact storage only: make the raw float32 vectors file hold `snap`'s rows. When
+        the file already holds a prefix of them (same epoch), only the new rows are
+        appended; after a clear a new file is started so live mappings stay valid.
+        Rows are written a block at a time, never as one full matrix.
+        """
+        n = len(snap)
+        append = (self._vectors_path is not None and snap.epoch == self._vector_epoch
+                  and self._vector_rows <= n)
+        path = self._vectors_path if append else self.database_dir / f"vectors-{generation}.f32"
+        start = self._vector_rows if append else 0
+        with open(path, "r+b" if append else "wb") as f:
+            f.seek(start * snap.dim * 4)
+            for i in range(start, n, BLOCK_ROWS):
+                f.write(snap.rows(np.arange(i, min(n, i + BLOCK_ROWS))).tobytes())
+            # Drops rows appended by a checkpoint that crashed before its pickle was written
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+        return path
+
+    def _open_vectors(self, path: Path, rows: int, dim: int) -> np.ndarray:
+        if not rows:
+            return np.empty((0, dim), np.float32)
+        return np.memmap(path, dtype=np.float32, mode="r", shape=(rows, dim))
+
+    def _trained_index(self, index, base: np.ndarray):
+        """The index to checkpoint over `base`, retrained when the gallery has doubled since it was built."""
+        if len(base) and (index is None or index.kind != self.storage or index.trained_rows * 2 < len(base)):
+            return build_index(self.storage, base)
+        return index
+
+    def _map_vectors(self, snap: GallerySnapshot, base: np.ndarray, index):
+        """
+        Swap in a snapshot whose first rows are read from the memory-mapped `base` and
+        indexed by `index`. Rows added since `snap` stay in the tail.
+        """
+        rows = len(base)
+        with self._lock:
+            cur = self._snapshot
+            if cur.epoch != snap.epoch or len(cur) < rows:
+                return
+            tail = cur.rows(np.arange(rows, len(cur))) if len(cur) > rows else None
+            if index is snap.index:
+                index = cur.index
+            elif tail is not None:
+                index = index.add(tail)
+            self._snapshot = GallerySnapshot(cur.names, cur.wanted, cur.version, base=base, tail=tail,
+                                             index=index, face_ids=cur.face_ids, epoch=cur.epoch)
+
+    def _remove_stale_vectors(self, keep: Optional[Path]):
+        for old in list(self.database_dir.glob("vectors-*.f32")) + list(self.database_dir.glob("vectors-*.npy")):
+            if old != keep:
+                try:
+                    old.unlink()
+                except OSError:
+                    # Still mapped by a live snapshot on platforms that forbid it; retried next checkpoint
+                    pass
+
+    def _frame(self, payload: bytes) -> bytes:
+        return struct.pack("<III", self._generation, len(payload), zlib.crc32(payload)) + payload
+
+    def _commit(self, record: tuple):
+        """Apply a change, then return once it (and anything queued with it) is on disk."""
+        if self.read_only:
+            raise RuntimeError(f"Gallery {self.database_dir} was opened read-only")
+        with self._lock:
+            self._apply(record)
+            self._wal_buffer.append(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+            seq = self._next_seq
+            self._next_seq += 1
+        self._sync(seq)
+
+    def _sync(self, seq: int):
+        with self._sync_lock:
+            if self._synced_seq >= seq:
+                # Another writer's fsync already covered this record
+                return
+            with self._lock:
+                batch = self._wal_buffer
+                self._wal_buffer = []
+                upto = self._next_seq - 1
+                snap = self._snapshot
+            checkpointed = False
+            if self._wal_records + len(batch) >= self.checkpoint_every:
+                try:
+                    # `snap` already contains every record in `batch`
+                    self._write_checkpoint(snap)
+                    checkpointed = True
+                except OSError as e:
+                    # Disk full or I/O error: keep the batch durable in the log; retried next sync
+                    print(f"Checkpoint of {self.database_dir} failed, logging instead: {e}")
+            if not checkpointed:
+                if self._wal is None:
+                    self._wal = open(self.wal_file, "ab")
+                self._wal.write(b"".join(self._frame(payload) for payload in batch))
+                self._wal.flush()
+                os.fsync(self._wal.fileno())
+                self._wal_records += len(batch)
+            self._synced_seq = upto
+
+    def _write_checkpoint(self, snap: GallerySnapshot):
+        """
+        float32 storage pickles the whole matrix. Compact storage first appends new rows
+        to the vectors file, then pickles only names, flags, ids, the index's trained
+        parameters and a reference to the file: a crash in between leaves the previous
+        checkpoint (and its row count) intact.
+        """
+        # Only adopted once the checkpoint is durable: log frames written under a
+        # generation the checkpoint on disk doesn't have would be skipped on replay
+        generation = self._generation + 1
         data = {
-            "encodings": self.known_encodings,
-            "names": self.known_names,
-            'wanted': self.known_wanted
+            "names": list(snap.names),
+            'wanted': list(snap.wanted),
+            "face_ids": list(snap.face_ids),
+            "model_name": self.model_name,
+            "generation": generation
         }
-        with open(self.encodings_file, "wb") as f:
+        path = None
+        if self.storage == "float32":
+            data["encodings"] = snap.matrix
+        else:
+            path = self._persist_vectors(snap, generation)
+            base = self._open_vectors(path, len(snap), snap.dim)
+            index = self._trained_index(snap.index, base)
+            # The trained codebooks / scale, so a reload only re-encodes the rows
+            data.update(vectors=path.name, rows=len(snap), dim=snap.dim,
+                        index=index.params() if index is not None else None)
+        tmp_file = self.encodings_file.with_suffix(".pkl.tmp")
+        with open(tmp_file, "wb") as f:
             pickle.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.encodings_file)
+        self._generation = generation
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+        with open(self.wal_file, "wb") as f:
+            os.fsync(f.fileno())
+        self._wal_records = 0
+        if path is not None:
+            self._vectors_path, self._vector_rows, self._vector_epoch = path, len(snap), snap.epoch
+            self._map_vectors(snap, base, index)
+        self._remove_stale_vectors(path)
+
+    def save_database(self):
+        """Force a full checkpoint of the current state."""
+        if self.read_only:
+            raise RuntimeError(f"Gallery {self.database_dir} was opened read-only")
+        with self._sync_lock:
+            with self._lock:
+                self._wal_buffer = []
+                upto = self._next_seq - 1
+                snap = self._snapshot
+            self._write_checkpoint(snap)
+            self._synced_seq = upto
 
     def load_database(self):
-        if self.encodings_file.exists():
+        with self._sync_lock, self._lock:
+            version = self._snapshot.version + 1
+            self._snapshot = GallerySnapshot(version=version)
+            self._generation = 0
+            self._vectors_path, self._vector_rows, self._vector_epoch = None, 0, 0
+            data = None
+            if self.encodings_file.exists():
+                try:
+                    with open(self.encodings_file, "rb") as f:
+                        data = pickle.load(f)
+                except Exception as e:
+                    print(f"Error loading database: {e}")
+            if data is not None:
+                stored_model = data.get("model_name", LEGACY_MODEL_NAME)
+                if stored_model != self.model_name:
+                    # Loading would mix embedding spaces and the next checkpoint would overwrite the file
+                    raise ValueError(f"{self.encodings_file} holds {stored_model} embeddings, "
+                                     f"not {self.model_name}")
+                try:
+                    names = tuple(data["names"])
+                    wanted = [bool(w) for w in data.get('wanted', [])][:len(names)]
+                    wanted += [False] * (len(names) - len(wanted))
+                    face_ids = list(data.get("face_ids", []))[:len(names)]
+                    face_ids = tuple(face_ids + [None] * (len(names) - len(face_ids)))
+                    self._generation = data.get("generation", 0)
+                    if "vectors" in data:
+                        # Compact checkpoint: rows live in the raw vectors file it references
+                        path = self.database_dir / data["vectors"]
+                        rows, dim = data["rows"], data["dim"]
+                        matrix = self._open_vectors(path, rows, dim)
+                        if self.storage != "float32":
+                            self._vectors_path, self._vector_rows = path, rows
+                    else:
+                        matrix = to_unit_rows(data["encodings"])
+                    if self.storage == "float32":
+                        self._snapshot = GallerySnapshot(names, tuple(wanted), version, base=np.array(matrix),
+                                                         face_ids=face_ids)
+                    else:
+                        index = build_index(self.storage, matrix, data.get("index")) if len(matrix) else None
+                        mapped = isinstance(matrix, np.memmap)
+                        self._snapshot = GallerySnapshot(names, tuple(wanted), version,
+                                                         base=matrix if mapped else None,
+                                                         tail=None if mapped else matrix,
+                                                         index=index, face_ids=face_ids)
+                except Exception as e:
+                    print(f"Error loading database: {e}")
+            self._wal_records = self._replay_wal()
+            if self.storage != "float32" and self._vectors_path is None and len(self._snapshot) \
+                    and not self.read_only:
+                # A float32 checkpoint opened with compact storage: move its rows to a vectors file
+                self._write_checkpoint(self._snapshot)
+
+    def _replay_wal(self) -> int:
+        if not self.wal_file.exists():
+            return 0
+        with open(self.wal_file, "rb") as f:
+            data = f.read()
+        pos = 0
+        count = 0
+        while pos + 12 <= len(data):
+            generation, length, crc = struct.unpack_from("<III", data, pos)
+            payload = data[pos + 12:pos + 12 + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            pos += 12 + length
+            if generation != self._generation:
+                # Already folded into the checkpoint
+                continue
             try:
-                with open(self.encodings_file, "rb") as f:
-                    data = pickle.load(f)
-                    self.known_encodings = [np.array(e) for e in data["encodings"]]
-                    self.known_names = data["names"]
-                    self.known_wanted = data.get('wanted', [])
+                self._apply(pickle.loads(payload))
             except Exception as e:
-                print(f"Error loading database: {e}")
+                print(f"Error replaying database log: {e}")
+                pos -= 12 + length
+                break
+            count += 1
+        if pos < len(data) and not self.read_only:
+            # Torn write from a crash: drop the incomplete tail. A reader may just have
+            # caught the owner mid-append, so only the owner truncates.
+            print(f"Database log: discarding {len(data) - pos} bytes of incomplete records")
+            with open(self.wal_file, "r+b") as f:
+                f.truncate(pos)
+        return count
 
     def get_all_names(self) -> List[str]:
         # Return a list of dicts: {"name": name, "wanted": bool}
+        snap = self._snapshot
         result = {}
-        for i, n in enumerate(self.known_names):
-            w = False
-            if i < len(self.known_wanted):
-                w = bool(self.known_wanted[i])
+        for n, w in zip(snap.names, snap.wanted):
             if n in result:
                 # if any entry for same person is wanted, keep it wanted
                 result[n] = result[n] or w
@@ -97,70 +619,730 @@ class FaceDatabase:
     def set_wanted(self, name: str, wanted: bool = True):
         """
         Set the wanted flag for all entries with the given name. Returns True if updated at least one entry.
+        Only a small log record is written, not the whole gallery.
+        """
+        if name not in self._snapshot.names:
+            return False
+        self._commit(("set_wanted", name, bool(wanted)))
+        return True
+
+
+class GalleryMigration:
+    """
+    Background re-embedding of `source`'s stored enrollment crops into the `target`
+    gallery (another model), a small batch at a time so serving continues on `source`.
+
+    Progress is tracked by face id: crops already in `target` are skipped, so an
+    interrupted migration resumes where it stopped and enrollments mirrored to both
+    galleries meanwhile aren't embedded twice. Rows enrolled without a crop can't be
+    migrated and are counted as skipped.
+
+    A pass that skipped or failed any row ends "incomplete" (with the names still absent
+    from `target` in `missing_names`) rather than "done": switching to that gallery would
+    silently forget people. `on_complete(migration)` runs only after a "done" pass.
+    """
+
+    def __init__(self, source: FaceDatabase, target: FaceDatabase, batch_size: int = 16,
+                 pause_seconds: float = 0.05, on_complete=None):
+        if source.model_name == target.model_name:
+            raise ValueError(f"Source and target galleries both use {source.model_name}")
+        self.source = source
+        self.target = target
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self.on_complete = on_complete
+        self._stop = threading.Event()
+        self._thread = None
+        self._status = {
+            "source_model": source.model_name,
+            "target_model": target.model_name,
+            "state": "pending",
+            "total": 0,
+            "migrated": 0,
+            "failed": 0,
+            "skipped_no_crop": 0,
+            "missing_names": [],
+            "message": None,
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+        }
+
+    def start(self) -> "GalleryMigration":
+        self._thread = threading.Thread(target=self._run, name="gallery-migration", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout: float = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self) -> Dict:
+        return dict(self._status)
+
+    def _pending(self) -> List[Tuple[str, str, bool]]:
+        snap = self.source.snapshot()
+        done = set(self.target.snapshot().face_ids)
+        pending, seen = [], set()
+        for face_id, name, wanted in zip(snap.face_ids, snap.names, snap.wanted):
+            if face_id is not None and face_id not in done and face_id not in seen:
+                seen.add(face_id)
+                pending.append((face_id, name, wanted))
+        return pending
+
+    def _run(self):
+        status = self._status
+        status.update(state="running", started_at=time.time())
+        try:
+            snap = self.source.snapshot()
+            status["skipped_no_crop"] = sum(1 for f in snap.face_ids if f is None)
+            pending = self._pending()
+            status["total"] = len(pending)
+            for i in range(0, len(pending), self.batch_size):
+                if self._stop.is_set():
+                    status["state"] = "stopped"
+                    return
+                # Re-check against both galleries: rows may have been cleared or mirrored meanwhile
+                current = set(self.source.snapshot().face_ids)
+                done = set(self.target.snapshot().face_ids)
+                groups = {}
+                for face_id, name, wanted in pending[i:i + self.batch_size]:
+                    if face_id not in current or face_id in done:
+                        continue
+                    crop = self.source.load_crop(face_id)
+                    encoding = self.target.embed(crop) if crop is not None else None
+                    if encoding is None:
+                        status["failed"] += 1
+                        continue
+                    group = groups.setdefault((name, wanted), ([], []))
+                    group[0].append(encoding)
+                    group[1].append(face_id)
+                for (name, wanted), (encodings, face_ids) in groups.items():
+                    status["migrated"] += self.target.add_encodings(name, encodings, wanted, face_ids)
+                time.sleep(self.pause_seconds)
+            target_names = set(self.target.snapshot().names)
+            missing = sorted(set(self.source.snapshot().names) - target_names)
+            status["missing_names"] = missing
+            if status["failed"] or status["skipped_no_crop"] or missing:
+                status.update(state="incomplete",
+                              message=f"{status['skipped_no_crop']} rows without a stored crop and "
+                                      f"{status['failed']} failed crops were not migrated; "
+                                      f"{len(missing)} people are missing from {self.target.model_name}")
+            else:
+                status["state"] = "done"
+        except Exception as e:
+            status.update(state="failed", error=str(e))
+            print(f"Gallery migration to {self.target.model_name} failed: {e}")
+        finally:
+            status["finished_at"] = time.time()
+        if status["state"] == "done" and self.on_complete is not None:
+            self.on_complete(self)
+
+
+class FaceQualityAssessor:
+    """
+    Cheap quality gate between detection and embedding. Scores a crop in [0, 1] from
+    sharpness, size, detector confidence and a frontal-pose proxy, so blurred, tiny or
+    extreme-profile faces that could never match are not sent to DeepFace.
+    """
+
+    def __init__(self, min_face_size: int = 40, min_sharpness: float = 30.0, min_score: float = 0.35):
+        self.min_face_size = min_face_size
+        self.min_sharpness = min_sharpness
+        self.min_score = min_score
+        self.buffers = FrameBuffers()
+
+    def assess(self, face_image: np.ndarray, detection_confidence: float = 1.0) -> Dict:
+        if face_image is None or face_image.size == 0:
+            return {"score": 0.0, "usable": False, "sharpness": 0.0, "size": 0}
+
+        h, w = face_image.shape[:2]
+        if face_image.ndim == 3:
+            gray = cv2.cvtColor(face_image, cv2.COLOR_BGR2GRAY, dst=self.buffers.take("gray", (h, w)))
+        else:
+            gray = face_image
+        # Measure on a fixed-size thumbnail so the score doesn't depend on resolution
+        small = cv2.resize(gray, (64, 64), dst=self.buffers.take("thumb", (64, 64)),
+                           interpolation=cv2.INTER_AREA)
+
+        sharpness = float(cv2.Laplacian(small, cv2.CV_64F).var())
+        sharp_score = min(1.0, sharpness / (2 * self.min_sharpness))
+        size_score = min(1.0, min(h, w) / (2 * self.min_face_size))
+        conf_score = float(np.clip(detection_confidence, 0.0, 1.0))
+
+        # Frontal faces are roughly left/right symmetric and ~0.8 as wide as tall;
+        # profiles are narrower and asymmetric.
+        aspect_score = max(0.0, 1.0 - abs(w / h - 0.8) / 0.6)
+        left = small[:, :32].astype(np.int16)
+        right = small[:, :31:-1].astype(np.int16)
+        symmetry_score = max(0.0, 1.0 - float(np.abs(left - right).mean()) / 64.0)
+        pose_score = 0.5 * aspect_score + 0.5 * symmetry_score
+
+        # Geometric mean: any single bad signal drags the whole score down
+        score = float((sharp_score * size_score * conf_score * pose_score) ** 0.25)
+        usable = (
+            min(h, w) >= self.min_face_size
+            and sharpness >= self.min_sharpness
+            and score >= self.min_score
+        )
+        return {
+            "score": score,
+            "usable": usable,
+            "sharpness": sharpness,
+            "size": int(min(h, w)),
+            "pose": pose_score,
+        }
+
+
+class FaceTracker:
+    """
+    Minimal IoU tracker for the video/webcam paths. A face seen over several frames
+    keeps the embedding of its best-quality crop, so it is only re-embedded when a
+    clearly better view shows up, or after `max_reuse` detections that reused it.
+
+    A loose association can hand a track to someone else who stepped into the same
+    spot, so a box overlapping its track below `reuse_iou`, or a track that missed a
+    detection update, ends that track and starts a new one, embedded afresh.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_age: int = 10, reuse_iou: float = 0.5,
+                 max_reuse: int = 5):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.reuse_iou = reuse_iou
+        self.max_reuse = max_reuse
+        self.tracks = {}
+        self.next_id = 0
+        self.updates = 0
+        self.stats = new_embedding_stats()
+
+    @staticmethod
+    def iou(a, b) -> float:
+        ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+        ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+        inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+        if inter == 0:
+            return 0.0
+        area_a = (a[2] - a[0]) * (a[3] - a[1])
+        area_b = (b[2] - b[0]) * (b[3] - b[1])
+        return inter / float(area_a + area_b - inter)
+
+    def update(self, boxes) -> List[int]:
+        """
+        Associate (x1, y1, x2, y2) boxes with existing tracks (greedy by IoU) and
+        return one track id per box. Tracks unseen for `max_age` updates are dropped.
+        Weak associations (see the class docstring) retire the track instead.
         """
-        updated = False
-        for i, n in enumerate(self.known_names):
-            if n == name:
-                while i >= len(self.known_wanted):
-                    self.known_wanted.append(False)
-                self.known_wanted[i] = bool(wanted)
-                updated = True
-        if updated:
-            self.save_database()
-        return updated
+        self.updates += 1
+        pairs = []
+        for i, box in enumerate(boxes):
+            for tid, track in self.tracks.items():
+                overlap = self.iou(box, track["box"])
+                if overlap >= self.iou_threshold:
+                    pairs.append((overlap, i, tid))
+        pairs.sort(reverse=True)
+
+        assigned = [None] * len(boxes)
+        claimed = [False] * len(boxes)
+        used = set()
+        retired = []
+        for overlap, i, tid in pairs:
+            if not claimed[i] and tid not in used:
+                claimed[i] = True
+                used.add(tid)
+                if overlap < self.reuse_iou or self.updates - self.tracks[tid]["last_seen"] > 1:
+                    retired.append(tid)
+                else:
+                    assigned[i] = tid
+        for tid in retired:
+            del self.tracks[tid]
+
+        for i, box in enumerate(boxes):
+            tid = assigned[i]
+            if tid is None:
+                tid = self.next_id
+                self.next_id += 1
+                self.tracks[tid] = {
+                    "box": box,
+                    "first_seen": self.updates,
+                    "best_quality": -1.0,
+                    "encoding": None,
+                    "model_name": None,
+                    # Detections that reused "encoding" since it was computed
+                    "reused": 0,
+                    # Confirmation-model embedding, valid while "encoding" is unchanged
+                    "confirm_encoding": None,
+                    "confirm_for": None,
+                }
+                assigned[i] = tid
+            track = self.tracks[tid]
+            track["box"] = box
+            track["last_seen"] = self.updates
+
+        for tid in [t for t, tr in self.tracks.items() if self.updates - tr["last_seen"] > self.max_age]:
+            del self.tracks[tid]
+
+        return assigned
+
+    @staticmethod
+    def forget(track: Dict):
+        """Drop a track's embedding so its next usable crop is embedded afresh."""
+        track.update(encoding=None, best_quality=-1.0, reused=0, confirm_encoding=None, confirm_for=None)
+
+
+class UnknownFaceClusterer:
+    """
+    Incremental clustering of embeddings that matched nobody in the gallery.
+
+    Each cluster keeps a running unit-norm centroid, a few sample embeddings and a lower
+    bound on the angle between its centroid and the nearest gallery row. Clusters seen
+    within `ttl_seconds` and verified against the current gallery version form a small
+    local cache: a repeat appearance within `cache_radius` of one of them is resolved as
+    that stranger without scanning the full gallery, but only when the angular triangle
+    inequality guarantees it is still farther than `tolerance` from every gallery row.
+    Any gallery change invalidates the cache, so an enrolled person is never hidden by it.
+
+    The default `threshold` and `cache_radius` suit Facenet's distances; use `for_model`
+    to scale them to another model's match tolerance.
+    """
+
+    def __init__(self, threshold: float = 0.3, cache_radius: float = 0.2, ttl_seconds: float = 120.0,
+                 max_clusters: int = 500, max_samples: int = 10):
+        self.threshold = threshold
+        self.cache_radius = cache_radius
+        self.ttl_seconds = ttl_seconds
+        self.max_clusters = max_clusters
+        self.max_samples = max_samples
+        self.clusters = {}
+        self.next_id = 0
+        self.stats = {"cache_hits": 0, "gallery_scans": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_model(cls, model_name: str, **kwargs) -> "UnknownFaceClusterer":
+        """Clusterer whose radii are the Facenet defaults' fractions of `model_name`'s tolerance."""
+        tolerance = model_tolerance(model_name)
+        return cls(threshold=0.75 * tolerance, cache_radius=0.5 * tolerance, **kwargs)
+
+    @staticmethod
+    def _unit(encoding) -> Optional[np.ndarray]:
+        enc = np.asarray(encoding, dtype=np.float64)
+        norm = np.linalg.norm(enc)
+        return enc / norm if norm > 0 else None
+
+    def _nearest(self, unit: np.ndarray, cluster_ids: List[int]) -> Tuple[Optional[int], float]:
+        if not cluster_ids:
+            return None, np.inf
+        centroids = np.stack([self.clusters[cid]["centroid"] for cid in cluster_ids])
+        distances = 1 - centroids @ unit
+        i = int(np.argmin(distances))
+        return cluster_ids[i], float(distances[i])
+
+    @staticmethod
+    def _angle(cosine_distance: float) -> float:
+        return float(np.arccos(np.clip(1 - cosine_distance, -1.0, 1.0)))
+
+    def _absorb(self, cluster: Dict, unit: np.ndarray, now: float):
+        cluster["count"] += 1
+        old = cluster["centroid"]
+        centroid = old + (unit - old) / cluster["count"]
+        cluster["centroid"] = centroid / (np.linalg.norm(centroid) or 1.0)
+        # The centroid moved by `shift`, so it may now be that much closer to the gallery
+        shift = float(np.arccos(np.clip(old @ cluster["centroid"], -1.0, 1.0)))
+        cluster["gallery_angle"] = max(0.0, cluster["gallery_angle"] - shift)
+        if len(cluster["samples"]) < self.max_samples \
+                and min(1 - s @ unit for s in cluster["samples"]) > 0.02:
+            cluster["samples"].append(unit)
+        cluster["last_seen"] = now
+
+    def lookup(self, encoding, gallery_version: int, tolerance: float) -> Optional[int]:
+        """
+        Return the id of a recent, still-unknown cluster this embedding belongs to, if it
+        provably can't match any gallery row within `tolerance`; None means scan the gallery.
+        """
+        unit = self._unit(encoding)
+        if unit is None:
+            return None
+        now = time.time()
+        with self._lock:
+            recent = [
+                cid for cid, c in self.clusters.items()
+                if c["verified_version"] == gallery_version and now - c["last_seen"] <= self.ttl_seconds
+                and len(c["centroid"]) == len(unit)
+            ]
+            cid, distance = self._nearest(unit, recent)
+            # angle(query, row) >= angle(centroid, row) - angle(query, centroid) for every row
+            if cid is None or distance >= self.cache_radius \
+                    or self.clusters[cid]["gallery_angle"] - self._angle(distance) <= self._angle(tolerance):
+                self.stats["gallery_scans"] += 1
+                return None
+            self._absorb(self.clusters[cid], unit, now)
+            self.stats["cache_hits"] += 1
+            return cid
+
+    def add(self, encoding, gallery_version: int, gallery_distance=None) -> Optional[int]:
+        """
+        Assign an embedding the full gallery scan left unknown to a cluster (new or
+        existing). `gallery_distance(unit_vector)` returns the cosine distance to the
+        nearest gallery row; without it the cluster is never used as a cache.
+        """
+        unit = self._unit(encoding)
+        if unit is None:
+            return None
+        now = time.time()
+        with self._lock:
+            candidates = [cid for cid, c in self.clusters.items() if len(c["centroid"]) == len(unit)]
+            cid, distance = self._nearest(unit, candidates)
+            if cid is not None and distance < self.threshold:
+                cluster = self.clusters[cid]
+                self._absorb(cluster, unit, now)
+            else:
+                if len(self.clusters) >= self.max_clusters:
+                    oldest = min(self.clusters, key=lambda k: self.clusters[k]["last_seen"])
+                    del self.clusters[oldest]
+                cid = self.next_id
+                self.next_id += 1
+                cluster = self.clusters[cid] = {
+                    "centroid": unit,
+                    "count": 1,
+                    "samples": [unit],
+                    "first_seen": now,
+                    "last_seen": now,
+                    "gallery_angle": 0.0,
+                }
+            cluster["verified_version"] = gallery_version
+            cluster["gallery_angle"] = self._angle(gallery_distance(cluster["centroid"])) \
+                if gallery_distance is not None else 0.0
+            return cid
+
+    def list_clusters(self, min_count: int = 1) -> List[Dict]:
+        with self._lock:
+            return [
+                {"id": cid, "count": c["count"], "samples": len(c["samples"]),
+                 "first_seen": c["first_seen"], "last_seen": c["last_seen"]}
+                for cid, c in sorted(self.clusters.items(), key=lambda kv: -kv[1]["count"])
+                if c["count"] >= min_count
+            ]
+
+    def export_cluster(self, cluster_id: int) -> List[np.ndarray]:
+        """Sample embeddings of a cluster, ready for FaceDatabase.add_encodings."""
+        with self._lock:
+            cluster = self.clusters.get(cluster_id)
+            return [s.copy() for s in cluster["samples"]] if cluster else []
+
+    def remove(self, cluster_id: int) -> bool:
+        with self._lock:
+            return self.clusters.pop(cluster_id, None) is not None
+
+
+class FrameBuffers:
+    """
+    Reusable scratch arrays for the per-frame path. `take` hands out a contiguous view
+    over a flat buffer that only grows, so variable-size crops don't allocate per face.
+    Views are only valid until the next `take` with the same name.
+    """
+
+    def __init__(self):
+        self._flat = {}
+
+    def take(self, name: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape))
+        flat = self._flat.get(name)
+        if flat is None or flat.dtype != dtype or flat.size < size:
+            flat = np.empty(size, dtype=dtype)
+            self._flat[name] = flat
+        return flat[:size].reshape(shape)
+
+
+def new_embedding_stats() -> Dict:
+    return {"crops": 0, "embedded": 0, "skipped_low_quality": 0, "reused_from_track": 0, "embed_seconds": 0.0,
+            "confirm_embedded": 0, "confirm_rejected": 0, "confirm_seconds": 0.0}
+
+
+def summarize_embedding_stats(stats: Dict) -> Dict:
+    """Add the derived 'how much embedding compute was saved' figures to a stats dict."""
+    saved = stats["skipped_low_quality"] + stats["reused_from_track"]
+    avg = stats["embed_seconds"] / stats["embedded"] if stats["embedded"] else 0.0
+    summary = dict(stats)
+    summary["embeddings_saved"] = saved
+    summary["saved_fraction"] = saved / stats["crops"] if stats["crops"] else 0.0
+    summary["avg_embed_seconds"] = avg
+    summary["estimated_seconds_saved"] = saved * avg
+    return summary
+
+
+class MatchingState:
+    """
+    What a frame is matched with: the gallery and its model, tolerance and stranger
+    clusters, plus the optional confirmation gallery. Never mutated; switching models
+    swaps in a new one, so a frame that read it once embeds and matches in a single
+    embedding space even while a migration activates another model.
+    """
+
+    __slots__ = ("database", "model_name", "tolerance", "unknown_clusters", "confirm_database",
+                 "confirm_tolerance")
+
+    def __init__(self, database: FaceDatabase, confirm_database: Optional[FaceDatabase] = None,
+                 unknown_clusters: "UnknownFaceClusterer" = None):
+        self.database = database
+        self.model_name = database.model_name
+        self.tolerance = model_tolerance(self.model_name)
+        # Cached strangers are embeddings of this model, clustered at its radii
+        self.unknown_clusters = unknown_clusters or UnknownFaceClusterer.for_model(self.model_name)
+        self.confirm_database = confirm_database
+        self.confirm_tolerance = model_tolerance(confirm_database.model_name) if confirm_database is not None else None
 
 
 class FaceRecognizer:
-    def __init__(self, model_path: str = "faces.pt", database: FaceDatabase = None, deepface_model_name: str = "Facenet"):
+    """
+    YOLO detection plus DeepFace matching against `database`, whose model is used for
+    every embedding. With a `confirm_database` (a gallery of a stronger model), the
+    first model only screens: its top candidates within a looser tolerance are
+    re-checked by embedding the crop with the confirmation model, once per track.
+    """
+
+    def __init__(self, model_path: str = "faces.pt", database: FaceDatabase = None,
+                 deepface_model_name: str = None, confirm_database: FaceDatabase = None):
         from ultralytics import YOLO
+        self.model_path = model_path
         self.yolo_model = YOLO(model_path)
-        self.database = database or FaceDatabase()
-        self.tolerance = 0.4
-        self.model_name = deepface_model_name
-        
-    def compare_with_database(self, encoding):
+        database = database or FaceDatabase(model_name=deepface_model_name or LEGACY_MODEL_NAME)
+        if deepface_model_name and deepface_model_name != database.model_name:
+            raise ValueError(f"Recognizer model {deepface_model_name} doesn't match the "
+                             f"{database.model_name} gallery")
+        # Swapped whole by set_database / set_confirm_database; see MatchingState
+        self._state = MatchingState(database, confirm_database)
+        self._state_lock = threading.Lock()
+        # Screening keeps this many candidates, up to `tolerance + screen_margin` away
+        self.screen_k = 5
+        self.screen_margin = 0.1
+        self.quality_assessor = FaceQualityAssessor()
+        # A tracked face is only re-embedded when a crop beats its best score by this much
+        self.requality_margin = 0.1
+        self.embedding_stats = new_embedding_stats()
+        self.buffers = FrameBuffers()
+
+    @property
+    def database(self) -> FaceDatabase:
+        return self._state.database
+
+    @property
+    def model_name(self) -> str:
+        return self._state.model_name
+
+    @property
+    def tolerance(self) -> float:
+        return self._state.tolerance
+
+    @property
+    def unknown_clusters(self) -> "UnknownFaceClusterer":
+        return self._state.unknown_clusters
+
+    @property
+    def confirm_database(self) -> Optional[FaceDatabase]:
+        return self._state.confirm_database
+
+    @property
+    def confirm_tolerance(self) -> Optional[float]:
+        return self._state.confirm_tolerance
+
+    def set_database(self, database: FaceDatabase):
+        """Switch to another model's gallery, e.g. once a migration has finished. Safe mid-frame."""
+        with self._state_lock:
+            confirm = self._state.confirm_database
+            if confirm is not None and confirm.model_name == database.model_name:
+                confirm = None
+            self._state = MatchingState(database, confirm)
+
+    def set_confirm_database(self, database: Optional[FaceDatabase]):
+        with self._state_lock:
+            state = self._state
+            self._state = MatchingState(state.database, database, state.unknown_clusters)
+
+    def compare_with_database(self, encoding, snapshot: GallerySnapshot = None, state: MatchingState = None):
         if encoding is None:
             return "Unknown", 0.0, -1
 
-        if not self.database.known_encodings:
+        state = state or self._state
+        snap = snapshot or state.database.snapshot()
+        if len(snap) == 0:
             return "Unknown", 0.0, -1
 
-        distances = []
-        for db_enc in self.database.known_encodings:
-            db_e = np.array(db_enc).astype(np.float64)
-            enc = np.array(encoding).astype(np.float64)
-
-            norm_prod = np.linalg.norm(db_e) * np.linalg.norm(enc)
-            if norm_prod == 0:
-                distances.append(np.inf)
-                continue
-
-            cos_sim = np.dot(db_e, enc) / norm_prod
-            cos_dist = 1 - cos_sim
-            distances.append(cos_dist)
+        enc = np.asarray(encoding, dtype=np.float32)
+        enc_norm = np.linalg.norm(enc)
+        if enc_norm == 0 or len(enc) != snap.dim:
+            # Embedded with another model than this gallery's
+            return "Unknown", 0.0, -1
 
-        distances = np.array(distances)
-        min_idx = np.argmin(distances)
-        min_distance = distances[min_idx]
+        min_idx, min_distance = snap.nearest(enc / enc_norm, state.database.rerank_k)
 
-        if min_distance < self.tolerance:
-            name = self.database.known_names[min_idx]
+        if min_distance < state.tolerance:
+            name = snap.names[min_idx]
             confidence = 1 - min_distance
             return name, confidence, min_idx
 
         return "Unknown", 0.0, -1
 
+    def screen(self, encoding, snapshot: GallerySnapshot = None,
+               state: MatchingState = None) -> List[Tuple[str, float, int]]:
+        """
+        Candidate identities for confirmation: (name, distance, index) of the closest
+        row per person among the top `screen_k`, within `tolerance + screen_margin`.
+        """
+        state = state or self._state
+        snap = snapshot or state.database.snapshot()
+        enc = np.asarray(encoding, dtype=np.float32)
+        enc_norm = np.linalg.norm(enc)
+        if len(snap) == 0 or enc_norm == 0 or len(enc) != snap.dim:
+            return []
+
+        idx, distances = snap.search(enc / enc_norm, self.screen_k, state.database.rerank_k)
+        candidates = {}
+        for i, d in zip(idx.tolist(), distances.tolist()):
+            name = snap.names[i]
+            if d < state.tolerance + self.screen_margin and name not in candidates:
+                candidates[name] = (name, d, i)
+        return list(candidates.values())
+
+    def confirm(self, face_image: np.ndarray, candidates: List[Tuple[str, float, int]], track: Dict = None,
+                confirm_snapshot: GallerySnapshot = None, state: MatchingState = None) -> Tuple[str, float, int]:
+        """
+        Re-check screening candidates with the confirmation model. Returns
+        (name, confidence, index) with `index` from the screening snapshot. Candidates
+        not yet enrolled in the confirmation gallery keep the screening verdict.
+        """
+        state = state or self._state
+        best_name, best_distance, best_index = candidates[0]
+        csnap = confirm_snapshot or state.confirm_database.snapshot()
+        names = {name: index for name, _, index in candidates}
+        rows = [i for i, n in enumerate(csnap.names) if n in names]
+        if not rows:
+            if best_distance < state.tolerance:
+                return best_name, 1 - best_distance, best_index
+            return "Unknown", 0.0, -1
+
+        if track is not None and track["confirm_for"] is track["encoding"] and track["confirm_encoding"] is not None:
+            strong = track["confirm_encoding"]
+        else:
+            started = time.perf_counter()
+            strong = self._embed(face_image, state.confirm_database.model_name)
+            self.embedding_stats["confirm_embedded"] += 1
+            self.embedding_stats["confirm_seconds"] += time.perf_counter() - started
+            if track is not None:
+                track["confirm_encoding"] = strong
+                track["confirm_for"] = track["encoding"]
+
+        norm = np.linalg.norm(strong) if strong is not None else 0
+        if norm == 0 or len(strong) != csnap.dim:
+            return "Unknown", 0.0, -1
+        distances = 1 - csnap.rows(np.array(rows)) @ (np.asarray(strong, dtype=np.float32) / norm)
+        j = int(np.argmin(distances))
+        if distances[j] < state.confirm_tolerance:
+            name = csnap.names[rows[j]]
+            return name, float(1 - distances[j]), names[name]
+        self.embedding_stats["confirm_rejected"] += 1
+        return "Unknown", 0.0, -1
+
+    def identify(self, encoding, snapshot: GallerySnapshot = None, face_image: np.ndarray = None,
+                 track: Dict = None, confirm_snapshot: GallerySnapshot = None, state: MatchingState = None):
+        """
+        Match an embedding, checking recently seen strangers before the full gallery.
+        Returns (name, confidence, index, unknown_cluster_id); `index` refers to `snapshot`.
+        Candidates are confirmed with the second model when one is set and a crop is given.
+        """
+        if encoding is None:
+            return "Unknown", 0.0, -1, None
+
+        state = state or self._state
+        snap = snapshot or state.database.snapshot()
+        if len(snap) and len(encoding) != snap.dim:
+            # Embedded with another model than this gallery's
+            return "Unknown", 0.0, -1, None
+        confirming = state.confirm_database is not None and face_image is not None
+        if confirming:
+            confirm_snapshot = confirm_snapshot or state.confirm_database.snapshot()
+            # A stranger verdict depends on both galleries
+            version = (snap.version, confirm_snapshot.version)
+            # Anything beyond the screening radius is never even confirmed
+            tolerance = state.tolerance + self.screen_margin
+        else:
+            version = snap.version
+            tolerance = state.tolerance
+        cluster_id = state.unknown_clusters.lookup(encoding, version, tolerance)
+        if cluster_id is not None:
+            return "Unknown", 0.0, -1, cluster_id
+
+        if confirming:
+            candidates = self.screen(encoding, snap, state)
+            if candidates:
+                name, confidence, index = self.confirm(face_image, candidates, track, confirm_snapshot, state)
+            else:
+                name, confidence, index = "Unknown", 0.0, -1
+        else:
+            name, confidence, index = self.compare_with_database(encoding, snap, state)
+        if index == -1:
+            cluster_id = state.unknown_clusters.add(
+                encoding, version, lambda unit: self._gallery_distance(unit, snap, state.database.rerank_k))
+        return name, confidence, index, cluster_id
+
+    @staticmethod
+    def _gallery_distance(unit: np.ndarray, snap: GallerySnapshot, rerank_k: int) -> float:
+        """Cosine distance from a unit vector to the nearest row of `snap` (2.0 when empty)."""
+        if len(snap) == 0 or len(unit) != snap.dim:
+            return 2.0
+        return snap.nearest(np.asarray(unit, dtype=np.float32), rerank_k)[1]
+
+    def _embed(self, face_image: np.ndarray, model_name: str = None):
+        try:
+            face_rgb = cv2.cvtColor(face_image, cv2.COLOR_BGR2RGB,
+                                    dst=self.buffers.take("crop_rgb", face_image.shape))
+        except Exception:
+            face_rgb = face_image
+
+        try:
+            embed = DeepFace.represent(img_path=face_rgb,
+                                       model_name=model_name or self._state.model_name,
+                                       enforce_detection=False)
+        except Exception:
+            embed = None
+
+        if embed:
+            return np.array(embed[0]['embedding'])
+        return None
 
     def detect_and_recognize_faces(
         self,
         image: np.ndarray,
-        confidence_threshold: float = 0.5
+        confidence_threshold: float = 0.5,
+        tracker: FaceTracker = None
     ) -> Dict:
+        """
+        Detect faces with YOLO, drop crops that fail the quality gate and embed the rest.
+        When a `tracker` is given (video/webcam), each track keeps the embedding of its
+        best-quality crop and up to `tracker.max_reuse` later detections reuse it instead
+        of calling DeepFace again.
+
+        The whole frame is embedded and matched with the models active when it started.
+        """
+        state = self._state
         results = {
             "faces": [],
             "recognized": [],
             "face_locations": [],
-            "face_encodings": []
+            "face_encodings": [],
+            "face_qualities": [],
+            "track_ids": [],
+            "unknown_cluster_ids": [],
+            # Embedding space of "face_encodings"
+            "model_name": state.model_name
         }
         yolo_results = self.yolo_model(image, conf=confidence_threshold)
         detections = yolo_results[0].boxes
@@ -170,57 +1352,111 @@ class FaceRecognizer:
 
         face_locations = []
         face_encodings = []
+        face_qualities = []
+        face_images = []
+        # Faces left without an embedding because the crop was unusable
+        low_quality = []
 
-        for detection in detections:
-            x1, y1, x2, y2 = detection.xyxy[0].cpu().numpy()
-            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+        # One device->host transfer for all boxes instead of one per detection
+        h, w = image.shape[:2]
+        xyxy = detections.xyxy.cpu().numpy().astype(np.int64)
+        np.clip(xyxy[:, 0::2], 0, w, out=xyxy[:, 0::2])
+        np.clip(xyxy[:, 1::2], 0, h, out=xyxy[:, 1::2])
+        boxes = [tuple(int(v) for v in row) for row in xyxy]
+        confidences = detections.conf.cpu().numpy().tolist()
 
-            h, w = image.shape[:2]
-            x1, y1 = max(0, x1), max(0, y1)
-            x2, y2 = min(w, x2), min(h, y2)
+        track_ids = tracker.update(boxes) if tracker is not None else [None] * len(boxes)
+        stat_dicts = [self.embedding_stats] + ([tracker.stats] if tracker is not None else [])
 
+        for (x1, y1, x2, y2), det_conf, track_id in zip(boxes, confidences, track_ids):
             face_locations.append((y1, x2, y2, x1))
 
             face_image = image[y1:y2, x1:x2]
+            face_images.append(face_image)
             if face_image.size == 0:
                 face_encodings.append(None)
+                face_qualities.append(0.0)
+                low_quality.append(True)
                 continue
 
-            try:
-                face_rgb = cv2.cvtColor(face_image, cv2.COLOR_BGR2RGB)
-            except Exception:
-                face_rgb = face_image
+            quality = self.quality_assessor.assess(face_image, det_conf)
+            face_qualities.append(quality["score"])
+            track = tracker.tracks[track_id] if tracker is not None else None
+            for st in stat_dicts:
+                st["crops"] += 1
 
-            try:
-                embed = DeepFace.represent(img_path=face_rgb,
-                                           model_name=self.model_name,
-                                           enforce_detection=False)
-            except Exception:
-                embed = None
+            if track is not None and track["model_name"] != state.model_name:
+                # The gallery model changed while this track was alive
+                FaceTracker.forget(track)
 
-            if embed:
-                emb = np.array(embed[0]['embedding'])
-                face_encodings.append(emb)
-            else:
-                face_encodings.append(None)
+            # A track's identity is only trusted for a few detections before it is re-checked
+            reusable = track is not None and track["encoding"] is not None \
+                and track["reused"] < tracker.max_reuse
+
+            if reusable and quality["score"] <= track["best_quality"] + self.requality_margin:
+                # Not a clearly better view than the one this track was identified from
+                track["reused"] += 1
+                face_encodings.append(track["encoding"])
+                low_quality.append(False)
+                for st in stat_dicts:
+                    st["reused_from_track"] += 1
+                continue
+
+            if not quality["usable"]:
+                # Defer: keep whatever the track still vouches for, otherwise leave it unidentified
+                if reusable:
+                    track["reused"] += 1
+                face_encodings.append(track["encoding"] if reusable else None)
+                low_quality.append(face_encodings[-1] is None)
+                for st in stat_dicts:
+                    st["skipped_low_quality"] += 1
+                continue
+
+            started = time.perf_counter()
+            emb = self._embed(face_image, state.model_name)
+            elapsed = time.perf_counter() - started
+            for st in stat_dicts:
+                st["embedded"] += 1
+                st["embed_seconds"] += elapsed
+
+            if emb is not None and track is not None:
+                track["encoding"] = emb
+                track["best_quality"] = quality["score"]
+                track["model_name"] = state.model_name
+                track["reused"] = 0
+            face_encodings.append(emb)
+            low_quality.append(False)
 
         results["face_locations"] = face_locations
         results["face_encodings"] = face_encodings
+        results["face_qualities"] = face_qualities
+        results["track_ids"] = track_ids
 
-        if self.database.known_encodings:
-            for encoding in face_encodings:
-                name, confidence, index = self.compare_with_database(encoding)
-                wanted = False
-                if index != -1 and len(self.database.known_wanted) > index:
-                    wanted = bool(self.database.known_wanted[index])
-                results["recognized"].append((name, confidence, wanted))
-
-        else:
-            results["recognized"] = [("Unknown", 0.0, False)] * len(face_encodings)
+        # One snapshot per frame: concurrent writes can't misalign names and wanted flags
+        snap = state.database.snapshot()
+        csnap = state.confirm_database.snapshot() if state.confirm_database is not None else None
+        tracks = [tracker.tracks[t] if tracker is not None else None for t in track_ids]
+        for encoding, face_image, track, unusable in zip(face_encodings, face_images, tracks, low_quality):
+            if unusable:
+                # Not a non-match: the face may well be enrolled (or wanted), it just couldn't be checked
+                results["recognized"].append((LOW_QUALITY, 0.0, False))
+                results["unknown_cluster_ids"].append(None)
+                continue
+            name, confidence, index, cluster_id = self.identify(encoding, snap, face_image, track, csnap, state)
+            wanted = False
+            if index != -1 and len(snap.wanted) > index:
+                wanted = bool(snap.wanted[index])
+            results["recognized"].append((name, confidence, wanted))
+            results["unknown_cluster_ids"].append(cluster_id)
 
         return results
-    def draw_results(self, image: np.ndarray, detection_results: Dict) -> np.ndarray:
-        output = image.copy()
+
+    def get_embedding_stats(self) -> Dict:
+        return summarize_embedding_stats(self.embedding_stats)
+
+    def draw_results(self, image: np.ndarray, detection_results: Dict, in_place: bool = False) -> np.ndarray:
+        """Annotate detections. With `in_place=True` the caller's frame is drawn on directly."""
+        output = image if in_place else image.copy()
 
         for face_loc, (name, confidence, wanted) in zip(
             detection_results["face_locations"], 
@@ -231,6 +1467,9 @@ class FaceRecognizer:
             if name == "Unknown":
                 color = (0, 255, 255)   # Amarelo
                 label = "Desconhecido"
+            elif name == LOW_QUALITY:
+                color = (160, 160, 160)   # Cinza
+                label = "Baixa qualidade"
             else:
                 if wanted:
                     color = (0, 0, 255)  # Vermelho
@@ -0,0 +1,245 @@
+from typing import Tuple
+
+import numpy as np
+
+# Rows scored per block, so decoding compact codes only needs a small float32 scratch
+BLOCK_ROWS = 16384
+
+
+class FlatIndex:
+    """Exact inner-product search over float32 unit vectors."""
+
+    kind = "float32"
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.trained_rows = len(self.vectors)
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes
+
+    def add(self, vectors: np.ndarray) -> "FlatIndex":
+        return FlatIndex(np.vstack([self.vectors, vectors]))
+
+    def params(self) -> dict:
+        """Trained state to store with a checkpoint, so a reload only re-encodes rows."""
+        return {"kind": self.kind, "trained_rows": self.trained_rows}
+
+    @classmethod
+    def from_params(cls, vectors: np.ndarray, params: dict) -> "FlatIndex":
+        index = cls(vectors)
+        index.trained_rows = params["trained_rows"]
+        return index
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        return self.vectors @ query
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Indices and approximate inner products of the `k` best rows, best first."""
+        scores = self.scores(np.asarray(query, dtype=np.float32))
+        k = min(k, len(scores))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+
+class Float16Index(FlatIndex):
+    """Half-precision copy of the gallery: 2 bytes per dimension."""
+
+    kind = "float16"
+
+    def __init__(self, vectors: np.ndarray):
+        self.codes = np.ascontiguousarray(vectors, dtype=np.float16)
+        self.trained_rows = len(self.codes)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes
+
+    def add(self, vectors: np.ndarray) -> "Float16Index":
+        new = Float16Index(np.empty((0, self.codes.shape[1])))
+        new.codes = np.vstack([self.codes, vectors.astype(np.float16)])
+        new.trained_rows = self.trained_rows
+        return new
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        out = np.empty(len(self.codes), dtype=np.float32)
+        for i in range(0, len(self.codes), BLOCK_ROWS):
+            out[i:i + BLOCK_ROWS] = self.codes[i:i + BLOCK_ROWS].astype(np.float32) @ query
+        return out
+
+
+class Int8Index(FlatIndex):
+    """
+    Scalar quantization: one int8 per dimension with a per-dimension scale learned from
+    the gallery. The query is pre-multiplied by the scales so codes are used as-is.
+    """
+
+    kind = "int8"
+
+    def __init__(self, vectors: np.ndarray, scale: np.ndarray = None):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if scale is None:
+            scale = np.zeros(vectors.shape[1], dtype=np.float32)
+            for i in range(0, len(vectors), BLOCK_ROWS):
+                np.maximum(scale, np.abs(vectors[i:i + BLOCK_ROWS]).max(axis=0), out=scale)
+            scale = np.maximum(scale / 127.0, 1e-8).astype(np.float32) if len(vectors) \
+                else np.ones(vectors.shape[1], dtype=np.float32)
+        self.scale = scale
+        self.codes = self._encode(vectors)
+        self.trained_rows = len(vectors)
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        # Block by block, so encoding a memory-mapped gallery needs no full float copy
+        codes = np.empty(vectors.shape, dtype=np.int8)
+        for i in range(0, len(vectors), BLOCK_ROWS):
+            codes[i:i + BLOCK_ROWS] = np.clip(np.rint(vectors[i:i + BLOCK_ROWS] / self.scale), -127, 127)
+        return codes
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scale.nbytes
+
+    def add(self, vectors: np.ndarray) -> "Int8Index":
+        new = Int8Index(np.empty((0, len(self.scale)), dtype=np.float32), self.scale)
+        new.codes = np.vstack([self.codes, self._encode(np.asarray(vectors, dtype=np.float32))])
+        new.trained_rows = self.trained_rows
+        return new
+
+    def params(self) -> dict:
+        return {"kind": self.kind, "trained_rows": self.trained_rows, "scale": self.scale}
+
+    @classmethod
+    def from_params(cls, vectors: np.ndarray, params: dict) -> "Int8Index":
+        index = cls(vectors, params["scale"])
+        index.trained_rows = params["trained_rows"]
+        return index
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        scaled = query * self.scale
+        out = np.empty(len(self.codes), dtype=np.float32)
+        for i in range(0, len(self.codes), BLOCK_ROWS):
+            out[i:i + BLOCK_ROWS] = self.codes[i:i + BLOCK_ROWS].astype(np.float32) @ scaled
+        return out
+
+
+def _kmeans(x: np.ndarray, k: int, iters: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        d = (x * x).sum(1, keepdims=True) - 2 * x @ centroids.T + (centroids * centroids).sum(1)
+        assign = d.argmin(1)
+        for c in range(k):
+            members = x[assign == c]
+            if len(members):
+                centroids[c] = members.mean(0)
+    return centroids
+
+
+class PQIndex(FlatIndex):
+    """
+    Product quantization: the vector is split into `m` sub-vectors, each replaced by the
+    id of its nearest of 256 learned centroids (one byte). Search uses asymmetric
+    distance computation: the float query is scored against every centroid once, and
+    each row's score is then the sum of `m` table lookups.
+    """
+
+    kind = "pq"
+
+    def __init__(self, vectors: np.ndarray, m: int = None, iters: int = 15,
+                 train_size: int = 20000, seed: int = 0):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        d = vectors.shape[1]
+        m = m or max(1, d // 8)
+        if d % m:
+            raise ValueError(f"PQ needs the dimension ({d}) to be a multiple of m ({m})")
+        self.m = m
+        self.sub = d // m
+        rng = np.random.default_rng(seed)
+        train = vectors if len(vectors) <= train_size else vectors[rng.choice(len(vectors), train_size, replace=False)]
+        ks = min(256, len(train))
+        self.codebooks = np.stack([
+            _kmeans(train[:, j * self.sub:(j + 1) * self.sub], ks, iters, rng) for j in range(m)
+        ]).astype(np.float32)
+        self.codes = self._encode(vectors)
+        self.trained_rows = len(vectors)
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for i in range(0, len(vectors), BLOCK_ROWS):
+            block = np.asarray(vectors[i:i + BLOCK_ROWS], dtype=np.float32)
+            for j in range(self.m):
+                x = block[:, j * self.sub:(j + 1) * self.sub]
+                c = self.codebooks[j]
+                d = (x * x).sum(1, keepdims=True) - 2 * x @ c.T + (c * c).sum(1)
+                codes[i:i + BLOCK_ROWS, j] = d.argmin(1)
+        return codes
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.codebooks.nbytes
+
+    def add(self, vectors: np.ndarray) -> "PQIndex":
+        new = PQIndex.__new__(PQIndex)
+        new.m, new.sub, new.codebooks = self.m, self.sub, self.codebooks
+        new.codes = np.vstack([self.codes, self._encode(np.asarray(vectors, dtype=np.float32))])
+        new.trained_rows = self.trained_rows
+        return new
+
+    def params(self) -> dict:
+        return {"kind": self.kind, "trained_rows": self.trained_rows, "codebooks": self.codebooks}
+
+    @classmethod
+    def from_params(cls, vectors: np.ndarray, params: dict) -> "PQIndex":
+        index = cls.__new__(cls)
+        index.codebooks = params["codebooks"]
+        index.m, _, index.sub = index.codebooks.shape
+        index.codes = index._encode(vectors)
+        index.trained_rows = params["trained_rows"]
+        return index
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        # lut[j, c] = <query sub-vector j, centroid c of subspace j>
+        lut = np.einsum("jcs,js->jc", self.codebooks, query.reshape(self.m, self.sub))
+        cols = np.arange(self.m)
+        out = np.empty(len(self.codes), dtype=np.float32)
+        for i in range(0, len(self.codes), BLOCK_ROWS):
+            out[i:i + BLOCK_ROWS] = lut[cols, self.codes[i:i + BLOCK_ROWS]].sum(axis=1)
+        return out
+
+
+INDEX_TYPES = {
+    "float32": FlatIndex,
+    "float16": Float16Index,
+    "int8": Int8Index,
+    "pq": PQIndex,
+}
+
+
+def build_index(kind: str, vectors: np.ndarray, params: dict = None):
+    """
+    Build a gallery index of the given kind over float32 unit vectors. With `params`
+    from a previous index of the same kind, its training is reused instead of redone.
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown gallery storage '{kind}', expected one of {sorted(INDEX_TYPES)}")
+    if params is not None and params.get("kind") == kind and params["trained_rows"] * 2 >= len(vectors):
+        return INDEX_TYPES[kind].from_params(vectors, params)
+    if kind == "pq" and len(vectors) < 256:
+        # Too few rows to learn codebooks; half precision is still compact and exact enough
+        return Float16Index(vectors)
+    return INDEX_TYPES[kind](vectors)
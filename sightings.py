@@ -0,0 +1,313 @@
+import sqlite3
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+
+class UnknownIndex:
+    """
+    Unit-norm embeddings of unknown sightings for one model, in a buffer that grows by
+    doubling so new rows are appended in place rather than the matrix being rebuilt.
+    `mark` is the last sighting id folded in.
+    """
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = None
+        self.count = 0
+        self.mark = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1] if self.vectors is not None else 0
+
+    def view(self):
+        """(embedding ids, matrix) of the live rows; valid until the next append/remove."""
+        if self.vectors is None:
+            return self.ids[:0], np.empty((0, 0), dtype=np.float32)
+        return self.ids[:self.count], self.vectors[:self.count]
+
+    def append(self, ids: List[int], vectors: List[np.ndarray]):
+        if self.vectors is None and vectors:
+            self.vectors = np.empty((0, len(vectors[0])), dtype=np.float32)
+        rows = [(i, v) for i, v in zip(ids, vectors) if len(v) == self.dim]
+        if not rows:
+            return
+        needed = self.count + len(rows)
+        if needed > len(self.ids):
+            capacity = max(needed, 2 * len(self.ids), 64)
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown = np.empty((capacity, self.dim), dtype=np.float32)
+            grown_ids[:self.count] = self.ids[:self.count]
+            grown[:self.count] = self.vectors[:self.count]
+            self.ids, self.vectors = grown_ids, grown
+        block = np.vstack([v for _, v in rows])
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        norms[norms == 0] = np.inf
+        self.ids[self.count:needed] = [i for i, _ in rows]
+        self.vectors[self.count:needed] = block / norms
+        self.count = needed
+
+    def remove(self, ids):
+        ids_view, vectors = self.view()
+        keep = ~np.isin(ids_view, np.asarray(list(ids), dtype=np.int64))
+        kept = int(keep.sum())
+        if kept == self.count:
+            return
+        self.ids[:kept] = ids_view[keep]
+        self.vectors[:kept] = vectors[keep]
+        self.count = kept
+
+
+class SightingStore:
+    """
+    Persistent record of every face seen in processed images and videos: source,
+    frame/timestamp, box, identity, confidence, wanted flag and a reference to the raw
+    embedding. Faces that failed the quality gate are kept with identity "low_quality"
+    (never compared with the gallery), so they aren't mistaken for cleared strangers.
+
+    Embeddings live in their own table: a tracked face reuses one embedding over many
+    detections, and all of those sightings reference a single stored copy.
+
+    Rows are indexed by identity and by source/time. Embeddings of unknown faces are
+    also kept in an in-memory index per embedding model, so a newly enrolled person can
+    be matched against past footage without running detection again. The index is
+    brought up to date by appending sightings committed since it was last used (by any
+    process); it is only rebuilt after sightings were relabeled.
+    """
+
+    def __init__(self, database_dir: str = "sightings", flush_every: int = 256):
+        self.database_dir = Path(database_dir)
+        self.database_dir.mkdir(exist_ok=True)
+        self.db_path = self.database_dir / "sightings.db"
+        self.flush_every = flush_every
+        self._lock = threading.RLock()
+        self._pending = []
+        # id(encoding array) -> (weakref to it, [blob, model, embedding id once written]),
+        # so detections reusing a track's embedding share one stored copy
+        self._embedding_refs = {}
+        # model name -> UnknownIndex of unknown sightings with an embedding
+        self._unknown_index = {}
+        # PRAGMA data_version the indexes were last synced at; it moves when another
+        # connection (e.g. a parallel video worker) commits
+        self._data_version = None
+        # meta.relabels when the indexes were built; relabeling can remove rows from them
+        self._relabels = 0
+
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sightings (
+                id INTEGER PRIMARY KEY,
+                source TEXT NOT NULL,
+                frame INTEGER,
+                timestamp REAL,
+                x INTEGER, y INTEGER, w INTEGER, h INTEGER,
+                identity TEXT NOT NULL,
+                confidence REAL,
+                wanted INTEGER NOT NULL DEFAULT 0,
+                embedding_id INTEGER,
+                model TEXT,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS embeddings (
+                id INTEGER PRIMARY KEY,
+                vector BLOB NOT NULL,
+                model TEXT
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO meta (key, value) VALUES ('relabels', 0);
+            CREATE INDEX IF NOT EXISTS idx_sightings_identity ON sightings(identity, created_at);
+            CREATE INDEX IF NOT EXISTS idx_sightings_source_time ON sightings(source, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_sightings_created ON sightings(created_at);
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(sightings)")}
+        if "model" not in columns:
+            # Stores created before embeddings were tagged; those were all Facenet
+            self.conn.execute("ALTER TABLE sightings ADD COLUMN model TEXT")
+            self.conn.execute("UPDATE sightings SET model = 'Facenet' WHERE embedding IS NOT NULL")
+        if "embedding_id" not in columns:
+            # Stores that kept a copy of the embedding in every row: move them to the embeddings table
+            self.conn.execute("ALTER TABLE sightings ADD COLUMN embedding_id INTEGER")
+            self.conn.execute("INSERT INTO embeddings (id, vector, model) "
+                              "SELECT id, embedding, model FROM sightings WHERE embedding IS NOT NULL")
+            self.conn.execute("UPDATE sightings SET embedding_id = id, embedding = NULL WHERE embedding IS NOT NULL")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_sightings_embedding ON sightings(embedding_id)")
+        self.conn.commit()
+
+    def _embedding_entry(self, encoding, model: str) -> List:
+        """The (possibly not yet written) embeddings row for an encoding array."""
+        key = id(encoding)
+        ref = self._embedding_refs.get(key)
+        if ref is not None and ref[0]() is encoding:
+            return ref[1]
+        entry = [np.asarray(encoding, dtype=np.float32).tobytes(), model, None]
+        try:
+            self._embedding_refs[key] = (weakref.ref(encoding), entry)
+        except TypeError:
+            # Not weak-referenceable (e.g. a list): stored once per sighting
+            pass
+        return entry
+
+    def record_detections(self, source: str, detection_results: Dict, frame: int = None,
+                          timestamp: float = None):
+        """
+        Queue one row per face in a `detect_and_recognize_faces` result. Rows are written
+        in batches; call `flush()` when the source is done.
+        """
+        now = time.time()
+        model = detection_results.get("model_name")
+        faces = zip(
+            detection_results.get("recognized", []),
+            detection_results.get("face_locations", []),
+            detection_results.get("face_encodings", []),
+        )
+        with self._lock:
+            for (name, confidence, wanted), (top, right, bottom, left), encoding in faces:
+                entry = self._embedding_entry(encoding, model) if encoding is not None else None
+                self._pending.append((
+                    source, frame, timestamp,
+                    int(left), int(top), int(right - left), int(bottom - top),
+                    name, float(confidence), int(bool(wanted)), entry, model, now,
+                ))
+            if len(self._pending) >= self.flush_every:
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            rows = []
+            for row in self._pending:
+                entry = row[10]
+                if entry is not None and entry[2] is None:
+                    entry[2] = self.conn.execute("INSERT INTO embeddings (vector, model) VALUES (?, ?)",
+                                                 (entry[0], entry[1])).lastrowid
+                    # Written: only the id is needed from now on
+                    entry[0] = None
+                rows.append(row[:10] + (entry[2] if entry is not None else None,) + row[11:])
+            self.conn.executemany(
+                "INSERT INTO sightings (source, frame, timestamp, x, y, w, h, identity, "
+                "confidence, wanted, embedding_id, model, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self.conn.commit()
+            self._pending = []
+            self._embedding_refs = {k: v for k, v in self._embedding_refs.items() if v[0]() is not None}
+
+    def find_by_identity(self, name: str, since: float = None, until: float = None, limit: int = 500) -> List[Dict]:
+        """Sightings of `name`, newest first; `since`/`until` filter on processing time."""
+        return self._rows(
+            "SELECT id, source, frame, timestamp, x, y, w, h, identity, confidence, wanted, created_at "
+            "FROM sightings WHERE identity = ? AND created_at >= ? AND created_at <= ? "
+            "ORDER BY created_at DESC LIMIT ?",
+            (name, since or 0.0, until or float("inf"), limit)
+        )
+
+    def find_by_source(self, source: str, start: float = None, end: float = None, limit: int = 500) -> List[Dict]:
+        """Sightings within one image/video, ordered by position in the video."""
+        return self._rows(
+            "SELECT id, source, frame, timestamp, x, y, w, h, identity, confidence, wanted, created_at "
+            "FROM sightings WHERE source = ? AND COALESCE(timestamp, 0) >= ? AND COALESCE(timestamp, 0) <= ? "
+            "ORDER BY timestamp, frame LIMIT ?",
+            (source, start or 0.0, end if end is not None else float("inf"), limit)
+        )
+
+    def _get_unknown_index(self, model: str) -> UnknownIndex:
+        self.flush()
+        with self._lock:
+            data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                relabels = self.conn.execute("SELECT value FROM meta WHERE key = 'relabels'").fetchone()[0]
+                if relabels != self._relabels:
+                    # Sightings were relabeled elsewhere: rows may have to leave the indexes
+                    self._unknown_index = {}
+                    self._relabels = relabels
+                self._data_version = data_version
+            index = self._unknown_index.setdefault(model, UnknownIndex())
+            # Unknown sightings written since the index was last synced (ids only grow);
+            # rows committed after `top` is read are picked up next time
+            top = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM sightings").fetchone()[0]
+            rows = self.conn.execute(
+                "SELECT DISTINCT s.embedding_id, e.vector FROM sightings s JOIN embeddings e ON e.id = s.embedding_id "
+                "WHERE s.id > ? AND s.id <= ? AND s.identity = 'Unknown' AND e.model = ?",
+                (index.mark, top, model)
+            ).fetchall()
+            if rows:
+                known = set(index.view()[0].tolist())
+                new = [(eid, np.frombuffer(vector, dtype=np.float32)) for eid, vector in rows if eid not in known]
+                index.append([eid for eid, _ in new], [v for _, v in new])
+            index.mark = top
+            return index
+
+    def search_unknown(self, encoding, tolerance: float = 0.4, limit: int = 1000,
+                       model: str = "Facenet") -> List[Dict]:
+        """
+        Stored embeddings of past unknown sightings within cosine distance `tolerance`
+        of `encoding`, closest first, as {"embedding_id", "distance"}. Only sightings
+        embedded with `model` are comparable.
+        """
+        with self._lock:
+            ids, matrix = self._get_unknown_index(model).view()
+            enc = np.asarray(encoding, dtype=np.float32)
+            norm = np.linalg.norm(enc)
+            if len(ids) == 0 or norm == 0 or matrix.shape[1] != enc.shape[0]:
+                return []
+
+            distances = 1 - matrix @ (enc / norm)
+            hits = np.flatnonzero(distances < tolerance)
+            hits = hits[np.argsort(distances[hits])][:limit]
+            return [{"embedding_id": int(ids[i]), "distance": float(distances[i])} for i in hits]
+
+    def retro_match(self, name: str, encodings, wanted: bool = False, tolerance: float = 0.4,
+                    model: str = "Facenet") -> int:
+        """
+        Relabel past unknown sightings whose embedding matches any of `encodings`
+        (embedded with `model`) as `name`. Returns the number of sightings updated.
+        """
+        best = {}
+        for encoding in encodings:
+            for hit in self.search_unknown(encoding, tolerance, model=model):
+                eid = hit["embedding_id"]
+                if eid not in best or hit["distance"] < best[eid]:
+                    best[eid] = hit["distance"]
+        if not best:
+            return 0
+
+        with self._lock:
+            updated = 0
+            for eid, dist in best.items():
+                updated += self.conn.execute(
+                    "UPDATE sightings SET identity = ?, confidence = ?, wanted = ? "
+                    "WHERE embedding_id = ? AND identity = 'Unknown'",
+                    (name, 1 - dist, int(bool(wanted)), eid)
+                ).rowcount
+            # Tells other processes' indexes that rows left them
+            self.conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'relabels'")
+            self.conn.commit()
+            self._relabels += 1
+            index = self._unknown_index.get(model)
+            if index is not None:
+                index.remove(best)
+        return updated
+
+    def set_wanted(self, name: str, wanted: bool):
+        with self._lock:
+            self.flush()
+            self.conn.execute("UPDATE sightings SET wanted = ? WHERE identity = ?", (int(bool(wanted)), name))
+            self.conn.commit()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
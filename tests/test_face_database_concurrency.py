@@ -0,0 +1,166 @@
+"""
+Stress test for FaceDatabase: concurrent writers (add / set_wanted / clear) and
+readers taking snapshots, then a reload, a torn log tail, a crash between
+checkpoint and log truncation and a checkpoint that fails to write.
+"""
+import importlib.util
+import os
+import random
+import shutil
+import sys
+import threading
+import types
+
+import numpy as np
+import pytest
+
+if importlib.util.find_spec("deepface") is None:
+    # Nothing here embeds images; a placeholder lets face_processor import without TensorFlow
+    sys.modules["deepface"] = types.ModuleType("deepface")
+    sys.modules["deepface"].DeepFace = types.SimpleNamespace(represent=None)
+
+import face_processor  # noqa: E402
+from face_processor import FaceDatabase  # noqa: E402
+
+WRITERS = 8
+READERS = 4
+OPS_PER_WRITER = 120
+DIM = 32
+
+
+def encoding_for(writer: int, op: int) -> np.ndarray:
+    """Row whose largest component identifies the writer, so misaligned rows are detectable."""
+    rng = np.random.default_rng(writer * 100000 + op)
+    enc = rng.uniform(0, 0.1, DIM)
+    enc[writer] = 1.0
+    return enc
+
+
+def check_aligned(snap):
+    n = len(snap.names)
+    assert len(snap.wanted) == n
+    assert len(snap.face_ids) == n
+    matrix = snap.matrix
+    assert matrix.shape[0] == n
+    for name, face_id, row in zip(snap.names, snap.face_ids, matrix):
+        writer = int(name.split("-")[0][1:])
+        assert face_id.startswith(name + "/")
+        assert int(np.argmax(row[:WRITERS])) == writer
+
+
+def assert_same_state(a, b):
+    sa, sb = a.snapshot(), b.snapshot()
+    assert sa.names == sb.names
+    assert sa.wanted == sb.wanted
+    assert sa.face_ids == sb.face_ids
+    np.testing.assert_allclose(sa.matrix, sb.matrix, atol=1e-6)
+
+
+@pytest.mark.parametrize("storage", ["float32", "int8", "pq"])
+def test_concurrent_writers_and_readers(tmp_path, storage):
+    db = FaceDatabase(str(tmp_path), checkpoint_every=32, storage=storage)
+    errors = []
+    done = threading.Event()
+
+    def writer(w):
+        rng = random.Random(w)
+        added = []
+        try:
+            for op in range(OPS_PER_WRITER):
+                roll = rng.random()
+                if w == 0 and op == OPS_PER_WRITER // 2:
+                    db.clear()
+                elif added and roll < 0.3:
+                    db.set_wanted(rng.choice(added), rng.random() < 0.5)
+                else:
+                    name = f"w{w}-{op}"
+                    db.add_encodings(name, [encoding_for(w, op)], rng.random() < 0.2, [f"{name}/0"])
+                    added.append(name)
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    def reader():
+        try:
+            while not done.is_set():
+                check_aligned(db.snapshot())
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    readers = [threading.Thread(target=reader) for _ in range(READERS)]
+    writers = [threading.Thread(target=writer, args=(w,)) for w in range(WRITERS)]
+    for t in readers + writers:
+        t.start()
+    for t in writers:
+        t.join()
+    done.set()
+    for t in readers:
+        t.join()
+
+    assert not errors, errors
+    check_aligned(db.snapshot())
+    assert len(db.known_names) > 0
+
+    reloaded = FaceDatabase(str(tmp_path), storage=storage)
+    check_aligned(reloaded.snapshot())
+    assert_same_state(db, reloaded)
+
+
+def test_torn_log_tail_is_discarded(tmp_path):
+    db = FaceDatabase(str(tmp_path), checkpoint_every=1000)
+    for op in range(10):
+        db.add_encodings(f"w1-{op}", [encoding_for(1, op)], False, [f"w1-{op}/0"])
+    db.set_wanted("w1-3", True)
+    valid = os.path.getsize(db.wal_file)
+
+    # A crash mid-append leaves a partial frame behind
+    with open(db.wal_file, "ab") as f:
+        f.write(b"\x01\x00\x00\x00\xff\x00\x00\x00garbage")
+
+    reloaded = FaceDatabase(str(tmp_path), checkpoint_every=1000)
+    assert_same_state(db, reloaded)
+    assert os.path.getsize(reloaded.wal_file) == valid
+
+    reloaded.add_encodings("w2-0", [encoding_for(2, 0)], False, ["w2-0/0"])
+    again = FaceDatabase(str(tmp_path))
+    assert again.known_names == db.known_names + ("w2-0",)
+    check_aligned(again.snapshot())
+
+
+def test_crash_between_checkpoint_and_log_truncation(tmp_path):
+    db = FaceDatabase(str(tmp_path), checkpoint_every=1000)
+    for op in range(5):
+        db.add_encodings(f"w3-{op}", [encoding_for(3, op)], False, [f"w3-{op}/0"])
+    stale_log = tmp_path / "stale.wal"
+    shutil.copy(db.wal_file, stale_log)
+
+    db.save_database()
+    # As if the process died after replacing the checkpoint but before truncating the log
+    shutil.copy(stale_log, db.wal_file)
+
+    reloaded = FaceDatabase(str(tmp_path))
+    assert reloaded.known_names == tuple(f"w3-{op}" for op in range(5))
+    assert_same_state(db, reloaded)
+
+
+def test_failed_checkpoint_keeps_later_writes(tmp_path, monkeypatch):
+    db = FaceDatabase(str(tmp_path), checkpoint_every=4)
+    for op in range(3):
+        db.add_encodings(f"w4-{op}", [encoding_for(4, op)], False, [f"w4-{op}/0"])
+
+    def disk_full(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+
+    with monkeypatch.context() as m:
+        m.setattr(face_processor.pickle, "dump", disk_full)
+        # Both would trigger a checkpoint; they must still reach the log under the on-disk generation
+        for op in range(3, 5):
+            db.add_encodings(f"w4-{op}", [encoding_for(4, op)], False, [f"w4-{op}/0"])
+
+    reloaded = FaceDatabase(str(tmp_path))
+    assert reloaded.known_names == tuple(f"w4-{op}" for op in range(5))
+    assert_same_state(db, reloaded)
+
+    db.add_encodings("w4-5", [encoding_for(4, 5)], False, ["w4-5/0"])
+    again = FaceDatabase(str(tmp_path))
+    assert again.known_names == tuple(f"w4-{op}" for op in range(6))
+    check_aligned(again.snapshot())
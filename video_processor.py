@@ -0,0 +1,670 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from face_processor import FaceRecognizer, FaceDatabase, FaceTracker, LOW_QUALITY, new_embedding_stats
+from sightings import SightingStore
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+@lru_cache(maxsize=1)
+def ffmpeg_can_encode_h264() -> bool:
+    """
+    Whether FFmpegWriter can work here: some ffmpeg builds lack libx264 (or can't load
+    it), which only shows once frames are piped in. Checked once with a tiny encode.
+    """
+    if not ffmpeg_available():
+        return False
+    try:
+        subprocess.run(
+            ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "color=s=64x64:d=0.1",
+             "-c:v", "libx264", "-pix_fmt", "yuv420p", "-f", "null", "-"],
+            capture_output=True, check=True, timeout=30
+        )
+        return True
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"[ffmpeg] libx264 encoding unavailable, annotated videos use OpenCV: {e}")
+        return False
+
+
+def probe_video(path: str) -> Dict:
+    """
+    Return width, height, fps, frame_count and duration of a video. Uses ffprobe when
+    present and falls back to OpenCV's container metadata otherwise.
+
+    Width and height are those of the decoded frames: both ffmpeg and OpenCV apply the
+    rotation metadata of phone videos, so a 90/270 degree rotation swaps them.
+    """
+    if ffmpeg_available():
+        try:
+            out = subprocess.run(
+                ["ffprobe", "-v", "error", "-select_streams", "v:0",
+                 "-show_entries", "stream=width,height,avg_frame_rate,nb_frames:stream_tags=rotate"
+                                  ":stream_side_data=rotation:format=duration,start_time",
+                 "-of", "default=noprint_wrappers=1", path],
+                capture_output=True, text=True, check=True
+            ).stdout
+            fields = dict(line.split("=", 1) for line in out.splitlines() if "=" in line)
+            num, _, den = fields.get("avg_frame_rate", "0/1").partition("/")
+            fps = float(num) / float(den or 1) if float(den or 1) else 0.0
+            duration = float(fields["duration"]) if fields.get("duration", "N/A") != "N/A" else 0.0
+            start_time = float(fields["start_time"]) if fields.get("start_time", "N/A") != "N/A" else 0.0
+            frames = fields.get("nb_frames", "N/A")
+            frame_count = int(frames) if frames.isdigit() else int(round(duration * fps))
+            # Display-matrix side data (newer muxers) or the legacy rotate tag
+            rotation = fields.get("rotation") or fields.get("TAG:rotate") or "0"
+            width, height = int(fields["width"]), int(fields["height"])
+            if _is_quarter_turn(rotation):
+                width, height = height, width
+            return {
+                "width": width,
+                "height": height,
+                "fps": fps or 30.0,
+                "frame_count": frame_count,
+                "duration": duration,
+                "start_time": start_time,
+            }
+        except Exception as e:
+            print(f"[probe_video] ffprobe failed, using OpenCV: {e}")
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video: {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    # Whether the reported size accounts for rotation varies across OpenCV versions; a decoded frame doesn't lie
+    ok, first = cap.read()
+    if ok:
+        height, width = first.shape[:2]
+    info = {
+        "width": width,
+        "height": height,
+        "fps": fps,
+        "frame_count": frame_count,
+        "duration": frame_count / fps if fps else 0.0,
+        "start_time": 0.0,
+    }
+    cap.release()
+    return info
+
+
+def _is_quarter_turn(rotation) -> bool:
+    try:
+        return int(round(float(rotation))) % 180 == 90
+    except (TypeError, ValueError):
+        return False
+
+
+class FFmpegReader:
+    """
+    Decode a video through an ffmpeg subprocess, piping raw BGR frames into a single
+    reused buffer. `start`/`duration` use input-side `-ss`/`-t` seeking so only the
+    requested span is decoded; `every_n` drops the frames that won't be analyzed inside
+    ffmpeg, before they are converted and copied through the pipe. Frames are kept when
+    (index + offset) is a multiple of `every_n`, so segments stay aligned to the
+    global frame numbering. A decode that fails before the first frame raises with
+    ffmpeg's error output instead of looking like an empty video.
+    """
+
+    def __init__(self, path: str, width: int, height: int, start: float = None,
+                 duration: float = None, every_n: int = 1, offset: int = 0, threads: int = 0):
+        self.width = width
+        self.height = height
+        self.every_n = every_n
+        cmd = ["ffmpeg", "-v", "error", "-threads", str(threads)]
+        if start:
+            cmd += ["-ss", f"{start:.3f}"]
+        cmd += ["-i", path]
+        if duration:
+            cmd += ["-t", f"{duration:.3f}"]
+        if every_n > 1:
+            cmd += ["-vf", f"select=not(mod(n+{offset}\\,{every_n}))", "-vsync", "0"]
+        cmd += ["-an", "-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+        # A file rather than a pipe: nobody drains stderr while frames are being read
+        self.errors = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=self.errors)
+        self.frames = 0
+        self.frame = np.empty((height, width, 3), dtype=np.uint8)
+        self._view = memoryview(self.frame).cast("B")
+
+    def read(self):
+        """Return (ok, frame); the frame buffer is overwritten on the next read."""
+        filled = 0
+        total = len(self._view)
+        while filled < total:
+            n = self.proc.stdout.readinto(self._view[filled:])
+            if not n:
+                self._check_exit()
+                return False, None
+            filled += n
+        self.frames += 1
+        return True, self.frame
+
+    def _check_exit(self):
+        if self.proc.wait() == 0:
+            return
+        self.errors.seek(0)
+        message = f"ffmpeg decode failed: {self.errors.read().decode(errors='replace').strip()}"
+        if not self.frames:
+            raise RuntimeError(message)
+        print(f"[FFmpegReader] {message} (after {self.frames} frames)")
+
+    def release(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.stdout.close()
+        self.proc.wait()
+        self.errors.close()
+
+
+class OpenCVReader:
+    """Fallback reader with the same interface as FFmpegReader, built on cv2.VideoCapture."""
+
+    def __init__(self, path: str, fps: float, start: float = None, duration: float = None,
+                 every_n: int = 1, offset: int = 0):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise ValueError(f"Cannot open video: {path}")
+        if start:
+            self.cap.set(cv2.CAP_PROP_POS_MSEC, start * 1000.0)
+        self.remaining = int(round(duration * fps)) if duration else None
+        self.every_n = every_n
+        self.skip = (every_n - offset % every_n) % every_n
+        self.frame = None
+
+    def read(self):
+        # Skipped frames are grabbed but never converted to BGR
+        for _ in range(self.skip):
+            if self.remaining is not None:
+                if self.remaining <= 0:
+                    return False, None
+                self.remaining -= 1
+            if not self.cap.grab():
+                return False, None
+        if self.remaining is not None:
+            if self.remaining <= 0:
+                return False, None
+            self.remaining -= 1
+        self.skip = self.every_n - 1
+        ret, self.frame = self.cap.read(self.frame)
+        return ret, self.frame if ret else None
+
+    def release(self):
+        self.cap.release()
+
+
+class FFmpegWriter:
+    """
+    Encode raw BGR frames piped to ffmpeg as browser-compatible H.264 (yuv420p,
+    faststart) in a single pass, using libx264 with `threads` threads (0: one per
+    core). yuv420p needs even dimensions, so odd-sized videos get a one-pixel pad on
+    the right/bottom.
+    Only used when `ffmpeg_can_encode_h264()`; see `open_writer`.
+    """
+
+    def __init__(self, path: str, width: int, height: int, fps: float, threads: int = 0):
+        cmd = [
+            "ffmpeg", "-v", "error", "-y",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps:.3f}",
+            "-i", "-",
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-c:v", "libx264", "-preset", "veryfast", "-threads", str(threads),
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+            path,
+        ]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write(self, frame: np.ndarray):
+        try:
+            self.proc.stdin.write(memoryview(np.ascontiguousarray(frame)).cast("B"))
+        except BrokenPipeError:
+            # The encoder exited; report why instead of a bare broken pipe
+            self.proc.wait()
+            raise RuntimeError(f"ffmpeg encode failed: {self.proc.stderr.read().decode(errors='replace').strip()}")
+
+    def release(self):
+        try:
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        err = self.proc.stderr.read()
+        if self.proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg encode failed: {err.decode(errors='replace').strip()}")
+
+
+class OpenCVWriter:
+    """Fallback writer: mp4v through cv2.VideoWriter, then a best-effort H.264 re-encode."""
+
+    def __init__(self, path: str, width: int, height: int, fps: float):
+        self.path = path
+        self.fps = fps
+        self.out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+
+    def write(self, frame: np.ndarray):
+        self.out.write(frame)
+
+    def release(self):
+        self.out.release()
+        reencode_for_browser(self.path, self.fps)
+
+
+def open_writer(path: str, width: int, height: int, fps: float, use_ffmpeg: bool, threads: int = 0):
+    """FFmpegWriter when ffmpeg can encode H.264 here, OpenCVWriter otherwise."""
+    if use_ffmpeg and ffmpeg_can_encode_h264():
+        return FFmpegWriter(path, width, height, fps, threads)
+    return OpenCVWriter(path, width, height, fps)
+
+
+def reencode_for_browser(output_path: str, fps: float):
+    """
+    Second pass used only without ffmpeg: try to rewrite the file with an H264-like
+    fourcc for better browser compatibility, keeping the mp4v file if none is available.
+    """
+    try:
+        reencoded_path = f"{output_path}.re.mp4"
+        print(f"Attempting re-encode to H264-like fourcc for better browser compatibility: {reencoded_path}")
+        cap_re = cv2.VideoCapture(output_path)
+        if cap_re.isOpened():
+            w = int(cap_re.get(cv2.CAP_PROP_FRAME_WIDTH))
+            h = int(cap_re.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            fps_r = int(cap_re.get(cv2.CAP_PROP_FPS)) or fps
+            codecs_to_try = ["avc1", "H264", "X264"]
+            reencoded = False
+            for codec in codecs_to_try:
+                try:
+                    fourcc_re = cv2.VideoWriter_fourcc(*codec)
+                    out_re = cv2.VideoWriter(reencoded_path, fourcc_re, fps_r, (w, h))
+                    if not out_re.isOpened():
+                        print(f"Codec {codec} didn't open writer")
+                        continue
+                    cap_re.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    frame_r = None
+                    while True:
+                        ret_r, frame_r = cap_re.read(frame_r)
+                        if not ret_r:
+                            break
+                        out_re.write(frame_r)
+                    out_re.release()
+                    reencoded = True
+                    print(f"Re-encoding succeeded with codec {codec}")
+                    break
+                except Exception as e:
+                    print(f"Re-encode attempt with {codec} failed: {e}")
+            cap_re.release()
+            if reencoded and os.path.exists(reencoded_path):
+                os.replace(reencoded_path, output_path)
+                print(f"Reencoded file replaced the output: {output_path}")
+            elif os.path.exists(reencoded_path):
+                os.remove(reencoded_path)
+    except Exception as e:
+        print(f"Error during optional re-encoding: {e}")
+
+
+def process_video(
+    recognizer: FaceRecognizer,
+    input_path: str,
+    output_path: Optional[str] = None,
+    detect_every: int = 5,
+    start: float = None,
+    duration: float = None,
+    use_ffmpeg: bool = None,
+    sightings: SightingStore = None,
+    source: str = None,
+    ffmpeg_threads: int = 0
+) -> Dict:
+    """
+    Run detection/recognition every `detect_every` frames of `input_path`.
+
+    With `output_path`, every frame is decoded and the annotated video is written there.
+    Without it only the analyzed frames are decoded. `start`/`duration` restrict the
+    work to a time span (seconds); analyzed frames stay on the same global grid as a
+    full run. FFmpeg pipes are used when available unless `use_ffmpeg=False`, each
+    with `ffmpeg_threads` threads (0: one per core).
+    Every analyzed face is recorded in `sightings` under `source` when a store is given.
+
+    Besides the per-name tallies, returns one summary per face track (majority name and
+    its first/last detection box) so segment results can be stitched together.
+    """
+    if use_ffmpeg is None:
+        use_ffmpeg = ffmpeg_available()
+    info = probe_video(input_path)
+    width, height, fps = info["width"], info["height"], info["fps"]
+    annotate = output_path is not None
+    every_n = 1 if annotate else detect_every
+    first_frame = int(round(start * fps)) if start else 0
+    offset = first_frame % detect_every
+    reader_offset = 0 if annotate else offset
+
+    if use_ffmpeg:
+        reader = FFmpegReader(input_path, width, height, start, duration, every_n, reader_offset, ffmpeg_threads)
+    else:
+        reader = OpenCVReader(input_path, fps, start, duration, every_n, reader_offset)
+    writer = open_writer(output_path, width, height, fps, use_ffmpeg, ffmpeg_threads) if annotate else None
+
+    # Local index of the next frame the reader returns
+    frame_index = 0 if annotate else (detect_every - offset) % detect_every
+    frames_read = 0
+    detection_index = 0
+    recognized_count = 0
+    people_found = {}
+    tracks = {}
+    tracker = FaceTracker()
+    last_results = None
+    try:
+        while True:
+            ret, frame = reader.read()
+            if not ret:
+                break
+
+            if (frame_index + offset) % detect_every == 0:
+                results = recognizer.detect_and_recognize_faces(frame, tracker=tracker)
+                last_results = results
+                if sightings is not None:
+                    global_frame = first_frame + frame_index
+                    sightings.record_detections(source, results, frame=global_frame, timestamp=global_frame / fps)
+                for rec in (results and results.get("recognized", [])):
+                    # rec expected: (name, confidence, wanted)
+                    try:
+                        name = rec[0]
+                        wanted_flag = bool(rec[2]) if len(rec) > 2 else False
+                    except Exception:
+                        continue
+
+                    if name not in ("Unknown", LOW_QUALITY):
+                        if name not in people_found:
+                            people_found[name] = {"count": 0, "wanted": wanted_flag, "appearances": 0}
+                        people_found[name]["count"] += 1
+                        # If any detection shows wanted, keep it as wanted
+                        if wanted_flag:
+                            people_found[name]["wanted"] = True
+                        recognized_count += 1
+
+                for tid, rec, (top, right, bottom, left) in zip(
+                    results["track_ids"], results["recognized"], results["face_locations"]
+                ):
+                    box = (left, top, right, bottom)
+                    track = tracks.setdefault(tid, {"names": {}, "first": detection_index, "first_box": box})
+                    track["last"] = detection_index
+                    track["last_box"] = box
+                    if rec[0] not in ("Unknown", LOW_QUALITY):
+                        track["names"][rec[0]] = track["names"].get(rec[0], 0) + 1
+                detection_index += 1
+            else:
+                # Reuse last detection/recognition for intermediate frames to save processing time
+                results = last_results
+
+            if writer is not None:
+                if results:
+                    recognizer.draw_results(frame, results, in_place=True)
+                writer.write(frame)
+            frames_read += 1
+            frame_index += every_n
+    finally:
+        reader.release()
+        if writer is not None:
+            writer.release()
+        if sightings is not None:
+            sightings.flush()
+
+    track_summaries = []
+    for track in tracks.values():
+        name = max(track["names"], key=track["names"].get) if track["names"] else "Unknown"
+        if name in people_found:
+            people_found[name]["appearances"] += 1
+        track_summaries.append({
+            "name": name,
+            "first": track["first"],
+            "last": track["last"],
+            "first_box": track["first_box"],
+            "last_box": track["last_box"],
+        })
+
+    if annotate:
+        total_frames = frames_read
+    else:
+        # Frames after the last analyzed one were never decoded
+        span = int(round(duration * fps)) if duration else info["frame_count"] - first_frame
+        total_frames = max(span, frame_index - every_n + 1 if frames_read else 0)
+
+    return {
+        "total_frames": total_frames,
+        "people_found": people_found,
+        "total_recognized": recognized_count,
+        "fps": fps,
+        "embedding_stats": tracker.stats,
+        "tracks": track_summaries,
+        "detection_frames": detection_index,
+    }
+
+
+def keyframe_times(path: str) -> List[float]:
+    """Keyframe timestamps (seconds from the start of the file), read from packet flags."""
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path],
+        capture_output=True, text=True, check=True
+    ).stdout
+    times = []
+    for line in out.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags and pts not in ("", "N/A"):
+            times.append(float(pts))
+    return sorted(times)
+
+
+def plan_segments(path: str, workers: int, min_segment_seconds: float = 5.0) -> List[Tuple[float, Optional[float]]]:
+    """
+    Split a video into at most `workers` (start, duration) spans cut at the keyframes
+    closest to equal divisions, so every span decodes independently. The last span
+    has duration None (until the end).
+    """
+    info = probe_video(path)
+    duration = info["duration"]
+    n = max(1, min(workers, int(duration // min_segment_seconds)))
+    if n == 1:
+        return [(0.0, None)]
+
+    keyframes = [t - info["start_time"] for t in keyframe_times(path)]
+    starts = [0.0]
+    for i in range(1, n):
+        target = duration * i / n
+        candidates = [t for t in keyframes if starts[-1] < t < duration]
+        if not candidates:
+            break
+        best = min(candidates, key=lambda t: abs(t - target))
+        if best > starts[-1]:
+            starts.append(best)
+
+    return [(s, e - s) for s, e in zip(starts, starts[1:])] + [(starts[-1], None)]
+
+
+def concat_videos(paths: List[str], output_path: str):
+    """Join segments encoded with identical settings without re-encoding."""
+    list_path = f"{output_path}.concat.txt"
+    with open(list_path, "w") as f:
+        for p in paths:
+            f.write(f"file '{os.path.abspath(p)}'\n")
+    try:
+        subprocess.run(
+            ["ffmpeg", "-v", "error", "-y", "-f", "concat", "-safe", "0", "-i", list_path,
+             "-c", "copy", "-movflags", "+faststart", output_path],
+            capture_output=True, check=True
+        )
+    finally:
+        os.remove(list_path)
+
+
+def merge_segment_results(segments: List[Dict]) -> Dict:
+    """
+    Merge per-segment results in time order. A named track that is still visible in the
+    last detection of one segment and overlaps a same-named track in the first detection
+    of the next is the same appearance, so it is only counted once.
+    """
+    people_found = {}
+    stats = new_embedding_stats()
+    total_frames = 0
+    total_recognized = 0
+    for seg in segments:
+        total_frames += seg["total_frames"]
+        total_recognized += seg["total_recognized"]
+        for key in stats:
+            stats[key] += seg["embedding_stats"][key]
+        for name, v in seg["people_found"].items():
+            entry = people_found.setdefault(name, {"count": 0, "wanted": False, "appearances": 0})
+            entry["count"] += v["count"]
+            entry["wanted"] = entry["wanted"] or v["wanted"]
+            entry["appearances"] += v["appearances"]
+
+    for prev, nxt in zip(segments, segments[1:]):
+        ending = [t for t in prev["tracks"]
+                  if t["name"] != "Unknown" and t["last"] == prev["detection_frames"] - 1]
+        starting = [t for t in nxt["tracks"] if t["name"] != "Unknown" and t["first"] == 0]
+        used = set()
+        for t in ending:
+            for j, u in enumerate(starting):
+                if j not in used and u["name"] == t["name"] \
+                        and FaceTracker.iou(t["last_box"], u["first_box"]) >= 0.3:
+                    people_found[t["name"]]["appearances"] -= 1
+                    used.add(j)
+                    break
+
+    return {
+        "total_frames": total_frames,
+        "people_found": people_found,
+        "total_recognized": total_recognized,
+        "fps": segments[0]["fps"] if segments else 0.0,
+        "embedding_stats": stats,
+    }
+
+
+_worker_recognizer = None
+_worker_sightings = None
+_worker_threads = 0
+
+# Read by OpenMP / BLAS runtimes when they load, i.e. before the worker runs any code
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+@contextmanager
+def _worker_environment(threads: int):
+    """Set the thread-count variables inherited by worker processes spawned inside the block."""
+    saved = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+    os.environ.update({name: str(threads) for name in THREAD_ENV_VARS})
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _limit_threads(threads: int):
+    """Size a worker's OpenCV / torch / TensorFlow pools to its share of the cores, not all of them."""
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        pass
+    try:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except (ImportError, RuntimeError):
+        # Not installed, or its runtime already started
+        pass
+
+
+def _init_worker(model_path: str, database_dir: str, model_name: str, sightings_dir: str = None,
+                 confirm_model_name: str = None, threads: int = 1):
+    global _worker_recognizer, _worker_sightings, _worker_threads
+    _limit_threads(threads)
+    _worker_threads = threads
+    # The parent process owns the galleries (and may be writing them right now)
+    database = FaceDatabase(database_dir, model_name, read_only=True)
+    confirm = FaceDatabase(database_dir, confirm_model_name, read_only=True) if confirm_model_name else None
+    _worker_recognizer = FaceRecognizer(model_path, database, model_name, confirm)
+    _worker_sightings = SightingStore(sightings_dir) if sightings_dir else None
+
+
+def _process_segment(job: Tuple) -> Dict:
+    input_path, output_path, start, duration, detect_every, source = job
+    return process_video(_worker_recognizer, input_path, output_path, detect_every,
+                         start, duration, use_ffmpeg=True, sightings=_worker_sightings, source=source,
+                         ffmpeg_threads=_worker_threads)
+
+
+def process_video_parallel(
+    recognizer: FaceRecognizer,
+    input_path: str,
+    output_path: Optional[str] = None,
+    workers: int = None,
+    detect_every: int = 5,
+    sightings: SightingStore = None,
+    source: str = None,
+    threads_per_worker: int = None
+) -> Dict:
+    """
+    Process a long video as keyframe-aligned time segments, one worker process (with its
+    own FaceRecognizer) per segment, then join the annotated segments with a stream copy
+    and merge the tallies. Needs ffmpeg (with libx264 when annotating); without it, or
+    for short videos, this is just process_video.
+
+    Each worker's inference, OpenCV, BLAS and ffmpeg threads are capped at
+    `threads_per_worker` (default: its share of the cores), so N workers don't run N
+    full-size thread pools against each other.
+    """
+    # Each worker loads its own detector and embedding model; more than one per core only costs memory
+    workers = max(1, min(workers or os.cpu_count() or 1, os.cpu_count() or 1))
+    can_split = ffmpeg_available() and (output_path is None or ffmpeg_can_encode_h264())
+    segments = plan_segments(input_path, workers) if workers > 1 and can_split else [(0.0, None)]
+    if len(segments) == 1:
+        result = process_video(recognizer, input_path, output_path, detect_every,
+                               sightings=sightings, source=source)
+        result["segments"] = 1
+        return result
+
+    seg_dir = tempfile.mkdtemp(prefix="segments_", dir=os.path.dirname(output_path) or "." if output_path else None)
+    jobs = [
+        (input_path, os.path.join(seg_dir, f"seg_{i:04d}.mp4") if output_path else None,
+         start, duration, detect_every, source)
+        for i, (start, duration) in enumerate(segments)
+    ]
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // len(jobs))
+    print(f"[process_video_parallel] {input_path}: {len(jobs)} segments at {[round(s, 2) for s, _ in segments]}, "
+          f"{threads} threads each")
+    try:
+        with _worker_environment(threads), ProcessPoolExecutor(
+            max_workers=len(jobs),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(recognizer.model_path, str(recognizer.database.root_dir), recognizer.database.model_name,
+                      str(sightings.database_dir) if sightings is not None else None,
+                      recognizer.confirm_database.model_name if recognizer.confirm_database is not None else None,
+                      threads),
+        ) as pool:
+            results = list(pool.map(_process_segment, jobs))
+        if output_path:
+            concat_videos([job[1] for job in jobs], output_path)
+    finally:
+        shutil.rmtree(seg_dir, ignore_errors=True)
+
+    merged = merge_segment_results(results)
+    merged["segments"] = len(jobs)
+    return merged